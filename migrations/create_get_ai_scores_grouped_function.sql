@@ -0,0 +1,24 @@
+-- Create get_ai_scores_grouped function
+-- Returns all AI scores of a course already grouped as
+-- {"<sentence_id>": {"<slot_index>": score}}, so the worker does not
+-- need to reshape the rows one by one in Python
+-- Run this in your Supabase SQL editor
+
+CREATE OR REPLACE FUNCTION get_ai_scores_grouped(p_user_id UUID, p_course_id TEXT)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(jsonb_object_agg(sentence_id::text, slots), '{}'::jsonb)
+    FROM (
+        SELECT sentence_id,
+               jsonb_object_agg(slot_index::text, score::float8) AS slots
+        FROM ai_scores
+        WHERE user_id = p_user_id
+          AND course_id = p_course_id
+        GROUP BY sentence_id
+    ) AS grouped;
+$$;
+
+-- Add comment for documentation
+COMMENT ON FUNCTION get_ai_scores_grouped(UUID, TEXT) IS 'AI scores of a course grouped as {sentence_id: {slot_index: score}}';
@@ -0,0 +1,37 @@
+# gunicorn.conf.py
+"""
+Gunicorn 設定檔（正式環境啟動用）
+
+啟動方式（在 worker/ 目錄下）:
+    gunicorn -c gunicorn.conf.py
+
+使用 gthread worker：每個 process 以多執行緒處理請求，
+等待 Supabase / 外部 HTTP 回應時會釋放 GIL，其他請求可以同時進行。
+不使用 gevent：評分是 CPU-bound 的 torch 推論，會卡住 gevent 的事件迴圈。
+"""
+import os
+from pathlib import Path
+
+# app.py 以 `from routes.audio import ...` 匯入，需要在 src/ 下執行
+chdir = str(Path(__file__).resolve().parent / "src")
+wsgi_app = "app:create_app()"
+
+bind = os.getenv("WORKER_BIND", "0.0.0.0:5001")
+
+# 每個 worker process 都會載入一份模型，記憶體有限時維持少量 process
+workers = int(os.getenv("WORKER_PROCESSES", "1"))
+worker_class = "gthread"
+threads = int(os.getenv("WORKER_THREADS", "8"))
+
+# 評分請求可能需要數十秒（模型推論）
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+keepalive = 5
+
+
+def post_worker_init(worker):
+    """worker 啟動後先載入評分模型，避免第一個評分請求承擔載入時間"""
+    from services.audio_scorer import SCORER_PROCESSES, get_scorer
+
+    # 使用 process pool 時模型載入在 pool 的 worker 內進行
+    if SCORER_PROCESSES == 0:
+        get_scorer()
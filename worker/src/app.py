@@ -1,36 +1,133 @@
 # app.py (Main Application File)
+import atexit
+import logging
+import os
+import queue
+import tempfile
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
-# 1. 從您的 routes 檔案 import 那個 blueprint
-from routes.audio import audio_bp
 
-# 2. 建立 App
-app = Flask(__name__)
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    以 orjson 取代標準函式庫 json 的 JSON provider
+
+    jsonify / request.get_json 都會經過這裡，routes 不需要修改；
+    回應直接使用 orjson 產生的 bytes，省去 str -> bytes 的編碼
+    """
+
+    # 允許非字串 key (例如 int 的 slot_index)，並可直接輸出 numpy 數值
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option),
+            mimetype=self.mimetype
+        )
+
+
+def _configure_logging() -> None:
+    """
+    設定 root logger：請求執行緒只把紀錄放進 queue，
+    實際寫入 stderr 由背景的 QueueListener 執行緒完成，不會阻塞請求
+
+    等級由環境變數 LOG_LEVEL 控制（預設 INFO，除錯時設為 DEBUG）
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, QueueHandler) for h in root.handlers):
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
+    )
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+
+# 上傳音檔的暫存目錄，放在 tmpfs (RAM) 上避免磁碟寫入
+TMPFS_TEMP_DIR = '/dev/shm/echolearn'
+
+
+def _use_tmpfs_tempdir() -> None:
+    """
+    將 tempfile 的預設目錄指向 /dev/shm (tmpfs)
+
+    之後所有 tempfile / O_TMPFILE 暫存檔都直接寫在記憶體中；
+    非 Linux 或沒有 /dev/shm 時維持系統預設的暫存目錄
+    """
+    if not os.path.isdir('/dev/shm'):
+        return
+    try:
+        os.makedirs(TMPFS_TEMP_DIR, mode=0o700, exist_ok=True)
+    except OSError as e:
+        print(f"⚠️  無法建立 tmpfs 暫存目錄，使用預設暫存目錄: {e}")
+        return
+    tempfile.tempdir = TMPFS_TEMP_DIR
+
+
+def create_app() -> Flask:
+    """
+    建立並設定 Flask App
+
+    Blueprint 與 service 在函式內才 import，
+    只有真正建立 App 時才會載入 torch 等大型套件
+    （gunicorn 以 `app:create_app()` 呼叫）
+    """
+    _configure_logging()
+    _use_tmpfs_tempdir()
+
+    # 1. 建立 App
+    app = Flask(__name__)
+    app.json = OrjsonProvider(app)
+
+    # 限制單一請求大小，避免過大的上傳佔滿記憶體 / 暫存空間
+    app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024  # 20 MB
+
+    # 2. 設定 App 層級的 CORS
+    #    注意：CORS 應該在主 app 上設定，這樣才能套用到所有 blueprint
+    cors_origins = ["https://echo-learn.vercel.app", "localhost:3000"]
+    CORS(app, origins=cors_origins)
+    # 註：您可以簡化 CORS 設定，因為 Vercel API 會幫您過濾 /api/worker
+    # 您的 Python 只需要允許 Vercel 即可
+    # 但如果您想更嚴謹，可以保留 resources={r"/worker/*": {}}
 
-# 3. 設定 App 層級的 CORS
-#    注意：CORS 應該在主 app 上設定，這樣才能套用到所有 blueprint
-cors_origins = ["https://echo-learn.vercel.app", "localhost:3000"]
-CORS(app, origins=cors_origins)
-# 註：您可以簡化 CORS 設定，因為 Vercel API 會幫您過濾 /api/worker
-# 您的 Python 只需要允許 Vercel 即可
-# 但如果您想更嚴謹，可以保留 resources={r"/worker/*": {}}
+    # 3. 註冊 blueprint
+    from routes.audio import audio_bp
+    app.register_blueprint(audio_bp, url_prefix='/worker/audio')
 
+    # 4. 在應用啟動時初始化 Supabase 客戶端（避免每次請求都初始化）
+    print("🔧 初始化 Supabase 客戶端...")
+    from services.supabase_client import get_supabase_client
+    try:
+        get_supabase_client()
+        print("✅ Supabase 客戶端初始化完成")
+    except Exception as e:
+        print(f"⚠️  警告：Supabase 客戶端初始化失敗: {e}")
+        print("   評分快取功能將無法使用，但不影響評分功能")
 
-app.register_blueprint(audio_bp, url_prefix='/worker/audio')
+    return app
 
-# 4. 在應用啟動時初始化 Supabase 客戶端（避免每次請求都初始化）
-print("🔧 初始化 Supabase 客戶端...")
-from services.supabase_client import get_supabase_client
-try:
-    supabase_client = get_supabase_client()
-    print("✅ Supabase 客戶端初始化完成")
-except Exception as e:
-    print(f"⚠️  警告：Supabase 客戶端初始化失敗: {e}")
-    print("   評分快取功能將無法使用，但不影響評分功能")
 
 # 5. 啟動器
 if __name__ == '__main__':
+    app = create_app()
     print("可用的路由:")
     print(app.url_map) # 這會印出所有已註冊的路由表，方便除錯
     app.run(host='0.0.0.0', port=5001, debug=True)
@@ -3,16 +3,181 @@
 語音處理 API 路由 - 示範模板
 這是一個基本的架構範例，供其他開發者實作語音功能時參考
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
 from services.audio_service import transcribe_audio, analyze_pronunciation
-from services.audio_scorer import AudioScorer
+from services.audio_scorer import run_score
+from services.supabase_client import get_supabase_client
+from routes.schemas import CourseScoresQuery, ScoreAudioForm, ScoreSlot
+from pydantic import ValidationError
+from services import score_cache
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+import hashlib
+import logging
+import orjson
 import tempfile
+import threading
 import os
-import subprocess
+import shutil
+
+logger = logging.getLogger(__name__)
 
 # 創建 Blueprint
 audio_bp = Blueprint('audio', __name__)
 
+# 上傳檔案寫入磁碟時的緩衝區大小 (1 MiB)
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+T = TypeVar('T')
+
+# 進行中的評分 {key: Future}，讓相同的請求共用同一次計算
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def save_file(file: FileStorage, hasher=None) -> str:
+    """
+    將上傳的檔案以固定大小的區塊串流寫入暫存檔
+
+    Args:
+        file: request.files 中的上傳檔案
+        hasher: 可選的 hashlib 物件，寫入時同時計算內容雜湊
+
+    Returns:
+        暫存檔路徑（呼叫端負責刪除）
+    """
+    _, suffix = os.path.splitext(secure_filename(file.filename or ''))
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix or '.wav') as dst:
+        _copy_upload(file, dst, hasher)
+        return dst.name
+
+
+def _open_unlinked_tempfile() -> Optional[int]:
+    """
+    以 O_TMPFILE 開啟沒有目錄項目的暫存檔 (Linux)
+
+    Returns:
+        檔案描述子，平台或檔案系統不支援時回傳 None
+    """
+    if not hasattr(os, 'O_TMPFILE'):
+        return None
+    try:
+        return os.open(tempfile.gettempdir(), os.O_TMPFILE | os.O_RDWR, 0o600)
+    except OSError:
+        # 例如暫存目錄所在的檔案系統不支援 O_TMPFILE
+        return None
+
+
+def _copy_upload(file: FileStorage, dst, hasher=None) -> None:
+    """以 UPLOAD_CHUNK_SIZE 區塊複製上傳內容，同時餵給 hasher（如果有提供）"""
+    if hasher is None:
+        shutil.copyfileobj(file.stream, dst, length=UPLOAD_CHUNK_SIZE)
+        return
+    while chunk := file.stream.read(UPLOAD_CHUNK_SIZE):
+        dst.write(chunk)
+        hasher.update(chunk)
+
+
+def _content_hasher():
+    """上傳內容雜湊用的 hasher"""
+    return hashlib.blake2b(digest_size=16)
+
+
+@contextmanager
+def uploaded_file(file: FileStorage, hasher=None) -> Iterator[str]:
+    """
+    將上傳的檔案寫入暫存檔，離開 with 區塊後自動釋放
+
+    Linux 上使用 O_TMPFILE：檔案沒有目錄項目，關閉 fd 時由 kernel 回收，
+    不需要 stat / unlink，行程被強制終止也不會留下殘檔。
+    路徑使用 /proc/<pid>/fd/<fd>，評分的 process pool 子行程也能開啟。
+    其他平台退回 save_file + os.remove。
+
+    Args:
+        file: request.files 中的上傳檔案
+        hasher: 可選的 hashlib 物件，寫入時同時計算內容雜湊（不需要再讀一次檔案）
+
+    Example:
+        with uploaded_file(request.files['file']) as path:
+            result = transcribe_audio(path)
+    """
+    fd = _open_unlinked_tempfile()
+    if fd is None:
+        path = save_file(file, hasher)
+        try:
+            yield path
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return
+
+    try:
+        with os.fdopen(fd, 'wb', closefd=False) as dst:
+            _copy_upload(file, dst, hasher)
+        yield f"/proc/{os.getpid()}/fd/{fd}"
+    finally:
+        os.close(fd)
+
+
+def _flight_key(*parts: str) -> str:
+    """將請求參數正規化後雜湊成 single-flight 的 key"""
+    return hashlib.blake2b('|'.join(parts).encode(), digest_size=16).hexdigest()
+
+
+def single_flight(key: Optional[str], fn: Callable[[], T]) -> T:
+    """
+    相同 key 的計算同時只執行一次
+
+    第一個請求負責執行 fn，執行期間進來的相同 key 請求等待同一個 Future，
+    避免使用者重複點擊或重試時重複跑模型推論
+
+    Args:
+        key: 去重用的 key，None 表示不去重直接執行
+        fn: 實際的計算
+
+    Returns:
+        fn 的回傳值（例外也會傳給所有等待中的請求）
+    """
+    if key is None:
+        return fn()
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not is_leader:
+        return future.result()
+
+    try:
+        result = fn()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def validation_error(e: ValidationError):
+    """將 Pydantic 驗證錯誤轉成 400 回應"""
+    return jsonify({
+        "success": False,
+        "error": "Invalid request parameters",
+        "details": e.errors(include_url=False, include_context=False, include_input=False)
+    }), 400
+
 
 @audio_bp.route('/scores', methods=['GET'])
 def get_scores():
@@ -37,43 +202,46 @@ def get_scores():
         }
     """
     try:
-        from services.supabase_client import get_supabase_client
+        try:
+            query = CourseScoresQuery.model_validate(request.args.to_dict())
+        except ValidationError as e:
+            return validation_error(e)
 
-        user_id = request.args.get('user_id')
-        course_id = request.args.get('course_id')
+        user_id = query.user_id
+        course_id = query.course_id
 
-        if not user_id or not course_id:
-            return jsonify({
-                "success": False,
-                "error": "Missing user_id or course_id"
-            }), 400
+        logger.debug("📥 收到評分查詢請求 user_id=%s course_id=%s", user_id, course_id)
 
-        print(f"\n{'='*60}")
-        print(f"📥 收到評分查詢請求")
-        print(f"{'='*60}")
-        print(f"user_id: {user_id}")
-        print(f"course_id: {course_id}")
-        print(f"{'='*60}\n")
+        cached_scores = score_cache.get_course_scores(user_id, course_id)
+        if cached_scores is not None:
+            logger.debug("✅ 使用 Redis 快取的評分")
+            return jsonify({
+                "success": True,
+                "scores": cached_scores
+            })
 
         supabase = get_supabase_client()
-        scores_list = supabase.get_ai_scores_by_course(
+
+        # 優先由資料庫端直接分組成 {sentence_id: {slot_index: score}}
+        scores_dict = supabase.get_ai_scores_grouped(
             user_id=user_id,
             course_id=course_id
         )
 
-        # 轉換為前端需要的格式：{sentence_id: {slot_index: score}}
-        scores_dict = {}
-        for item in scores_list:
-            sentence_id = str(item['sentence_id'])
-            slot_index = str(item['slot_index'])
-            score = float(item['score'])
-
-            if sentence_id not in scores_dict:
-                scores_dict[sentence_id] = {}
+        if scores_dict is None:
+            # RPC 無法使用時，在這裡轉換為前端需要的格式
+            scores_list = supabase.get_ai_scores_by_course(
+                user_id=user_id,
+                course_id=course_id
+            )
 
-            scores_dict[sentence_id][slot_index] = score
+            grouped = defaultdict(dict)
+            for item in scores_list:
+                grouped[str(item['sentence_id'])][str(item['slot_index'])] = float(item['score'])
+            scores_dict = dict(grouped)
 
-        print(f"✅ 找到 {len(scores_list)} 個評分")
+        logger.debug("✅ 找到 %d 個句子的評分", len(scores_dict))
+        score_cache.set_course_scores(user_id, course_id, scores_dict)
 
         return jsonify({
             "success": True,
@@ -81,7 +249,7 @@ def get_scores():
         })
 
     except Exception as e:
-        print(f"❌ 獲取評分失敗: {str(e)}")
+        logger.error("❌ 獲取評分失敗: %s", e)
         return jsonify({
             "success": False,
             "error": str(e)
@@ -107,44 +275,35 @@ def delete_score():
         }
     """
     try:
-        from services.supabase_client import get_supabase_client
-
-        data = request.get_json()
+        data = request.get_json(silent=True)
         if not data:
             return jsonify({
                 "success": False,
                 "error": "Missing request body"
             }), 400
 
-        user_id = data.get('user_id')
-        course_id = data.get('course_id')
-        sentence_id = data.get('sentence_id')
-        slot_index = data.get('slot_index')
-
-        if not all([user_id, course_id, sentence_id is not None, slot_index is not None]):
-            return jsonify({
-                "success": False,
-                "error": "Missing required fields: user_id, course_id, sentence_id, slot_index"
-            }), 400
+        try:
+            slot = ScoreSlot.model_validate(data)
+        except ValidationError as e:
+            return validation_error(e)
 
-        print(f"\n{'='*60}")
-        print(f"🗑️  收到評分刪除請求")
-        print(f"{'='*60}")
-        print(f"user_id: {user_id}")
-        print(f"course_id: {course_id}")
-        print(f"sentence_id: {sentence_id}")
-        print(f"slot_index: {slot_index}")
-        print(f"{'='*60}\n")
+        logger.debug(
+            "🗑️  收到評分刪除請求 user_id=%s course_id=%s sentence_id=%s slot_index=%s",
+            slot.user_id, slot.course_id, slot.sentence_id, slot.slot_index
+        )
 
         supabase = get_supabase_client()
         result = supabase.delete_ai_score(
-            user_id=user_id,
-            course_id=course_id,
-            sentence_id=int(sentence_id),
-            slot_index=int(slot_index)
+            user_id=slot.user_id,
+            course_id=slot.course_id,
+            sentence_id=slot.sentence_id,
+            slot_index=slot.slot_index
         )
 
         if result['success']:
+            score_cache.delete_slot_score(
+                slot.user_id, slot.course_id, slot.sentence_id, slot.slot_index
+            )
             return jsonify({"success": True})
         else:
             return jsonify({
@@ -153,7 +312,7 @@ def delete_score():
             }), 500
 
     except Exception as e:
-        print(f"❌ 刪除評分失敗: {str(e)}")
+        logger.error("❌ 刪除評分失敗: %s", e)
         return jsonify({
             "success": False,
             "error": str(e)
@@ -185,14 +344,9 @@ def transcribe():
         file = request.files['file']
         language = request.form.get('language', 'en')
 
-        # TODO: 儲存上傳的檔案
-        # file_path = save_file(file)
-
-        # 呼叫 service 層處理
-        # result = transcribe_audio(file_path, language)
-
-        # 目前返回示範回應
-        result = transcribe_audio('', language)
+        # 儲存上傳的檔案並呼叫 service 層處理
+        with uploaded_file(file) as file_path:
+            result = transcribe_audio(file_path, language)
 
         return jsonify({
             "success": True,
@@ -235,14 +389,9 @@ def pronunciation():
         if not reference_text:
             return jsonify({"success": False, "error": "Reference text is required"}), 400
 
-        # TODO: 儲存上傳的檔案
-        # file_path = save_file(file)
-
-        # 呼叫 service 層處理
-        # result = analyze_pronunciation(file_path, reference_text, language)
-
-        # 目前返回示範回應
-        result = analyze_pronunciation('', reference_text, language)
+        # 儲存上傳的檔案並呼叫 service 層處理
+        with uploaded_file(file) as file_path:
+            result = analyze_pronunciation(file_path, reference_text, language)
 
         return jsonify({
             "success": True,
@@ -254,14 +403,29 @@ def pronunciation():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+# 健康檢查的回應內容固定，在 import 時序列化一次
+_HEALTH_BODY = orjson.dumps({
+    "success": True,
+    "service": "audio-processing",
+    "status": "ready for implementation"
+})
+_HEALTH_ETAG = hashlib.blake2b(_HEALTH_BODY, digest_size=8).hexdigest()
+
+
 @audio_bp.route('/health', methods=['GET'])
 def health_check():
-    """健康檢查 API"""
-    return jsonify({
-        "success": True,
-        "service": "audio-processing",
-        "status": "ready for implementation"
-    })
+    """
+    健康檢查 API
+
+    回傳預先序列化的內容並附上 ETag / Cache-Control，
+    load balancer 帶 If-None-Match 探測時直接回 304
+    """
+    # 每次建立新的 Response：flask-cors 等 after_request 會修改 headers，不能共用同一個物件
+    response = Response(_HEALTH_BODY, mimetype='application/json')
+    response.set_etag(_HEALTH_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = 30
+    return response.make_conditional(request)
 
 
 @audio_bp.route('/score', methods=['POST'])
@@ -285,13 +449,7 @@ def score_audio():
             "cached": bool    # 是否從資料庫讀取
         }
     """
-    ref_path = None
-    test_path = None
-    wav_path = None
-
     try:
-        from services.supabase_client import get_supabase_client
-
         reference_audio = request.files.get('reference_audio')
         test_audio = request.files.get('test_audio')
 
@@ -299,91 +457,107 @@ def score_audio():
             return jsonify({"success": False, "error": "Missing files"}), 400
 
         # 取得可選參數（用於儲存/讀取評分）
-        user_id = request.form.get('user_id')
-        course_id = request.form.get('course_id')
-        sentence_id_str = request.form.get('sentence_id')
-        slot_index_str = request.form.get('slot_index')
-
-        # Debug logging
-        print(f"\n{'='*60}")
-        print(f"📥 收到評分請求")
-        print(f"{'='*60}")
-        print(f"user_id: {user_id}")
-        print(f"course_id: {course_id}")
-        print(f"sentence_id: {sentence_id_str}")
-        print(f"slot_index: {slot_index_str}")
-        print(f"{'='*60}\n")
+        try:
+            form = ScoreAudioForm.model_validate(request.form.to_dict())
+        except ValidationError as e:
+            return validation_error(e)
+        slot = form.slot
+
+        logger.debug(
+            "📥 收到評分請求 user_id=%s course_id=%s sentence_id=%s slot_index=%s",
+            form.user_id, form.course_id, form.sentence_id, form.slot_index
+        )
 
         # 如果提供了完整參數，先檢查資料庫是否已有評分
-        if user_id and course_id and sentence_id_str and slot_index_str:
+        if slot is not None:
             try:
-                sentence_id = int(sentence_id_str)
-                slot_index = int(slot_index_str)
+                cached_score = score_cache.get_slot_score(
+                    slot.user_id, slot.course_id, slot.sentence_id, slot.slot_index
+                )
+                if cached_score is not None:
+                    logger.debug("✅ Using Redis cached AI score: %.2f", cached_score)
+                    return jsonify({
+                        "success": True,
+                        "rating": cached_score,
+                        "cached": True
+                    })
 
                 supabase = get_supabase_client()
                 cached_score = supabase.get_ai_score(
-                    user_id=user_id,
-                    course_id=course_id,
-                    sentence_id=sentence_id,
-                    slot_index=slot_index
+                    user_id=slot.user_id,
+                    course_id=slot.course_id,
+                    sentence_id=slot.sentence_id,
+                    slot_index=slot.slot_index
                 )
 
                 if cached_score is not None:
-                    print(f"✅ Using cached AI score: {cached_score:.2f}")
+                    logger.debug("✅ Using cached AI score: %.2f", cached_score)
                     return jsonify({
                         "success": True,
                         "rating": cached_score,
                         "cached": True
                     })
-            except (ValueError, Exception) as e:
-                print(f"⚠️  Failed to check cached score: {str(e)}")
+            except Exception as e:
+                logger.warning("⚠️  Failed to check cached score: %s", e)
                 # 繼續執行評分，不因為資料庫錯誤而中斷
 
-        # === 將兩個音檔存到暫存檔 ===
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as ref_tmp:
-            ref_path = ref_tmp.name
-            reference_audio.save(ref_path)
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as test_tmp:
-            test_path = test_tmp.name
-            test_audio.save(test_path)
-
-        # === 如果上傳的是 webm 格式，轉成 wav 格式 ===
-        wav_tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-        wav_path = wav_tmp.name
-        wav_tmp.close()
-
-        # ffmpeg 轉檔
-        subprocess.run([
-            "ffmpeg", "-y", "-i", test_path, wav_path
-        ], check=True, capture_output=True)
-
-        # === 呼叫 AudioScorer 進行評分 ===
-        scorer = AudioScorer()
-        rating = scorer.score(ref_path, wav_path)
-
-        # === 如果提供了完整參數，儲存評分到資料庫 ===
-        if user_id and course_id and sentence_id_str and slot_index_str:
-            try:
-                sentence_id = int(sentence_id_str)
-                slot_index = int(slot_index_str)
-
-                supabase = get_supabase_client()
-                save_result = supabase.save_ai_score(
-                    user_id=user_id,
-                    course_id=course_id,
-                    sentence_id=sentence_id,
-                    slot_index=slot_index,
-                    score=rating
-                )
-
-                if not save_result['success']:
-                    print(f"⚠️  Warning: Failed to save score to database: {save_result['error']}")
-                    # 不因為儲存失敗而中斷，仍然回傳評分結果
-
-            except (ValueError, Exception) as e:
-                print(f"⚠️  Warning: Failed to save score: {str(e)}")
-                # 繼續回傳結果
+        def compute_and_save() -> float:
+            # === 將兩個音檔以 1 MiB 區塊串流存到暫存檔，評分完自動釋放 ===
+            # 寫入時同時計算內容雜湊，相同的音檔內容（重錄、重試）直接使用快取的評分
+            ref_hasher = _content_hasher()
+            test_hasher = _content_hasher()
+            with uploaded_file(reference_audio, ref_hasher) as ref_path, \
+                    uploaded_file(test_audio, test_hasher) as test_path:
+                ref_hash = ref_hasher.hexdigest()
+                test_hash = test_hasher.hexdigest()
+
+                rating = score_cache.get_content_score(ref_hash, test_hash)
+                if rating is not None:
+                    logger.debug("✅ Using content-hash cached AI score: %.2f", rating)
+                else:
+                    # === 呼叫 AudioScorer 進行評分 ===
+                    # webm 等格式由 AudioScorer 在行程內直接解碼，不需要先用 ffmpeg 轉檔
+                    # 設定 SCORER_PROCESSES 時會交給 process pool 執行
+                    # 匿名請求也能依內容去重
+                    rating = single_flight(
+                        _flight_key('content', ref_hash, test_hash),
+                        lambda: run_score(ref_path, test_path)
+                    )
+                    score_cache.set_content_score(ref_hash, test_hash, rating)
+
+            # === 如果提供了完整參數，儲存評分到資料庫 ===
+            if slot is not None:
+                try:
+                    supabase = get_supabase_client()
+                    save_result = supabase.save_ai_score(
+                        user_id=slot.user_id,
+                        course_id=slot.course_id,
+                        sentence_id=slot.sentence_id,
+                        slot_index=slot.slot_index,
+                        score=rating
+                    )
+
+                    if save_result['success']:
+                        score_cache.set_slot_score(
+                            slot.user_id, slot.course_id, slot.sentence_id, slot.slot_index, rating
+                        )
+                    else:
+                        logger.warning("⚠️  Failed to save score to database: %s", save_result['error'])
+                        # 不因為儲存失敗而中斷，仍然回傳評分結果
+
+                except Exception as e:
+                    logger.warning("⚠️  Failed to save score: %s", e)
+                    # 繼續回傳結果
+
+            return rating
+
+        # 同一個槽位的評分同時只計算一次，重複的請求等待同一個結果
+        flight_key = None
+        if slot is not None:
+            flight_key = _flight_key(
+                slot.user_id, slot.course_id, str(slot.sentence_id), str(slot.slot_index)
+            )
+        rating = single_flight(flight_key, compute_and_save)
 
         return jsonify({
             "success": True,
@@ -392,15 +566,4 @@ def score_audio():
         })
 
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
-    finally:
-        # 無論成功失敗都刪掉暫存檔
-        try:
-            if ref_path and os.path.exists(ref_path):
-                os.remove(ref_path)
-            if test_path and os.path.exists(test_path):
-                os.remove(test_path)
-            if wav_path and os.path.exists(wav_path):
-                os.remove(wav_path)
-        except Exception:
-            pass
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)}), 500
\ No newline at end of file
@@ -0,0 +1,53 @@
+# routes/schemas.py
+"""
+API 請求參數的驗證與型別轉換 (Pydantic v2)
+集中處理必填欄位檢查與 int 轉換，避免各個 route 重複手寫判斷
+"""
+from typing import Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+
+class CourseScoresQuery(BaseModel):
+    """GET /scores 的 query 參數"""
+
+    user_id: str = Field(min_length=1)
+    course_id: str = Field(min_length=1)
+
+
+class ScoreSlot(CourseScoresQuery):
+    """指定單一錄音槽位的評分（DELETE /score 的 JSON body）"""
+
+    sentence_id: int
+    slot_index: int
+
+
+class ScoreAudioForm(BaseModel):
+    """
+    POST /score 的 form 欄位
+
+    全部為可選：只有四個欄位都提供時才會讀取 / 儲存資料庫中的評分
+    """
+
+    user_id: Optional[str] = None
+    course_id: Optional[str] = None
+    sentence_id: Optional[int] = None
+    slot_index: Optional[int] = None
+
+    @field_validator('*', mode='before')
+    @classmethod
+    def _empty_as_none(cls, value):
+        # multipart form 中的空字串視為沒有提供
+        return None if value == '' else value
+
+    @property
+    def slot(self) -> Optional[ScoreSlot]:
+        """四個欄位都有提供時回傳 ScoreSlot，否則回傳 None"""
+        if None in (self.user_id, self.course_id, self.sentence_id, self.slot_index):
+            return None
+        return ScoreSlot(
+            user_id=self.user_id,
+            course_id=self.course_id,
+            sentence_id=self.sentence_id,
+            slot_index=self.slot_index
+        )
@@ -0,0 +1,86 @@
+"""
+音訊讀取模組
+在行程內直接解碼任意格式（webm, wav, mp3 ...）為波形，不需要呼叫外部 ffmpeg
+"""
+
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import soundfile as sf
+import torch
+import torchaudio
+
+# Optional dependencies
+try:
+    import av
+
+    HAS_AV = True
+except ImportError:
+    av = None
+    HAS_AV = False
+
+
+def is_wav(path: Union[str, Path]) -> bool:
+    """依檔頭 (RIFF....WAVE) 判斷是否為 wav 檔，不依賴副檔名或 mimetype"""
+    with open(path, "rb") as f:
+        head = f.read(12)
+    return len(head) == 12 and head[:4] == b"RIFF" and head[8:12] == b"WAVE"
+
+
+def decode_audio(
+    path: Union[str, Path],
+    sample_rate: Optional[int] = None,
+) -> tuple[np.ndarray, int]:
+    """
+    使用 libav (PyAV) 解碼音檔為單聲道 float32 波形
+
+    Args:
+        path: 音檔路徑（格式由內容判斷，不依賴副檔名）
+        sample_rate: 目標採樣率 (None = 保留原始採樣率)
+
+    Returns:
+        (waveform [T], sample_rate)
+    """
+    with av.open(str(path)) as container:
+        stream = container.streams.audio[0]
+        rate = sample_rate or stream.codec_context.sample_rate
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=rate)
+
+        chunks = []
+        for frame in container.decode(stream):
+            for out in resampler.resample(frame):
+                chunks.append(out.to_ndarray())
+        # 取出 resampler 內殘留的樣本
+        for out in resampler.resample(None):
+            chunks.append(out.to_ndarray())
+
+    if not chunks:
+        return np.zeros(0, dtype=np.float32), rate
+    return np.concatenate(chunks, axis=1)[0], rate
+
+
+def load_waveform(path: Union[str, Path]) -> tuple[torch.Tensor, int]:
+    """
+    讀取音檔為 [1, T] 單聲道波形，介面同 torchaudio.load
+
+    Args:
+        path: 音檔路徑
+
+    Returns:
+        (waveform [1, T], sample_rate)
+    """
+    # wav 直接用 libsndfile 讀取，省去 libav 的容器探測與解碼器初始化
+    if is_wav(path):
+        wav, sr = sf.read(str(path), dtype="float32", always_2d=True)
+        return torch.from_numpy(wav.mean(axis=1)).unsqueeze(0), sr
+
+    if HAS_AV:
+        wav, sr = decode_audio(path)
+        return torch.from_numpy(wav).unsqueeze(0), sr
+
+    # Fallback: torchaudio（webm 等格式需要系統安裝 ffmpeg backend）
+    wav, sr = torchaudio.load(str(path))
+    if wav.shape[0] > 1:
+        wav = wav.mean(dim=0, keepdim=True)
+    return wav, sr
@@ -3,15 +3,25 @@
 整合所有語音評估指標，提供單一入口點
 """
 
-from typing import Dict, Union
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain
+from typing import Dict, List, Optional, Tuple, Union
 from pathlib import Path
+import parselmouth
 import torch
-import torchaudio
 
-from services.phoneme_ctc import PhoneCTC
+from services.audio_io import load_waveform
+from services.edit_distance import levenshtein
+from services.phoneme_ctc import PhoneCTC, SpanArr
 from services.speech_metrics import SpeechMetrics
 from services.cal_wer_gop import get_wer_score
-from services.predictor import RatingPredictor
+from services.predictor import get_predictor
 
 
 class AudioScorer:
@@ -56,7 +66,10 @@ class AudioScorer:
         self.speech_metrics = SpeechMetrics()
 
         print("初始化 RatingPredictor...")
-        self.rating_predictor = RatingPredictor()
+        self.rating_predictor = get_predictor()
+
+        # 音檔解碼用的背景執行緒，與模型推論重疊
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="audio-io")
 
         print("✅ AudioScorer 初始化完成")
 
@@ -70,37 +83,94 @@ class AudioScorer:
 
         Args:
             reference_audio: 參考音檔路徑
-            test_audio: 要評分的音檔路徑
+            test_audio: 要評分的音檔路徑（任何 libav 可解碼的格式，例如 webm）
 
         Returns:
             float: 模型預測的人類評分 (1-5 分)
         """
-        ref_path = str(reference_audio)
-        test_path = str(test_audio)
+        # 參考音檔推論的同時，背景執行緒先解碼測試音檔
+        test_loading = self._io_pool.submit(load_waveform, test_audio)
+        ref = self._analyze(reference_audio)
+        test = self._analyze(test_audio, test_loading.result())
+        return self._rate(ref, test)
 
-        scores = {}
+    def score_batch(
+        self,
+        pairs: List[Tuple[Union[str, Path], Union[str, Path]]]
+    ) -> List[float]:
+        """
+        批次計算多組 (參考音檔, 測試音檔) 的模型預測評分
 
-        # === 只計算模型需要的三個指標 ===
+        同一個音檔（例如多位學生共用的參考音檔）只解碼、推論一次，
+        之後的配對直接重用結果
 
-        # 1. PhoneCTC 相關指標 (PER, PPG)
-        ref_wav, ref_sr = torchaudio.load(ref_path)
-        test_wav, test_sr = torchaudio.load(test_path)
+        Args:
+            pairs: [(reference_audio, test_audio), ...]
+
+        Returns:
+            List[float]: 與 pairs 順序相同的評分 (1-5 分)
+
+        Example:
+            >>> ratings = scorer.score_batch([("ref.wav", "a.webm"), ("ref.wav", "b.webm")])
+        """
+        unique_paths = list(dict.fromkeys(str(path) for path in chain.from_iterable(pairs)))
+
+        # 推論目前音檔時，背景先解碼下一個音檔
+        features: Dict[str, dict] = {}
+        loading = self._io_pool.submit(load_waveform, unique_paths[0]) if unique_paths else None
+        for index, path in enumerate(unique_paths):
+            loaded = loading.result()
+            if index + 1 < len(unique_paths):
+                loading = self._io_pool.submit(load_waveform, unique_paths[index + 1])
+            features[path] = self._analyze(path, loaded)
+
+        return [self._rate(features[str(ref)], features[str(test)]) for ref, test in pairs]
+
+    def _analyze(
+        self,
+        audio: Union[str, Path],
+        loaded: Optional[Tuple[torch.Tensor, int]] = None
+    ) -> dict:
+        """
+        單一音檔的評分前處理：解碼波形、計算音素後驗與音素序列
+
+        Args:
+            audio: 音檔路徑
+            loaded: 已解碼的 (waveform, sample_rate)，None 時才讀檔
+
+        Returns:
+            dict: {'wav', 'sr', 'logp', 'phones'}
+        """
+        wav, sr = loaded if loaded is not None else load_waveform(audio)
 
         # 計算後驗機率和音素片段
-        ref_logp, ref_spans = self.ctc.posteriors_and_spans(ref_wav, ref_sr)
-        test_logp, test_spans = self.ctc.posteriors_and_spans(test_wav, test_sr)
+        logp, spans = self.ctc.posteriors_and_spans(wav, sr)
+
+        return {
+            'wav': wav,
+            'sr': sr,
+            'logp': logp,
+            'phones': self.ctc.phones_from_spans(spans)
+        }
+
+    def _rate(self, ref: dict, test: dict) -> float:
+        """由兩個音檔的前處理結果計算三個指標並預測評分"""
+        scores = {}
 
-        ref_phones = self.ctc.phones_from_spans(ref_spans)
-        test_phones = self.ctc.phones_from_spans(test_spans)
+        # === 只計算模型需要的三個指標 ===
 
+        # 1. PhoneCTC 相關指標 (PER, PPG)
         # PER 相似度 (1 - 音素錯誤率)
-        scores['PER'] = self._calculate_per_similarity(ref_phones, test_phones)
+        scores['PER'] = self._calculate_per_similarity(ref['phones'], test['phones'])
 
         # PPG 相似度
-        scores['PPG'] = self._calculate_ppg_similarity(ref_logp, test_logp)
+        scores['PPG'] = self._calculate_ppg_similarity(ref['logp'], test['logp'])
 
-        # 2. Energy 相似度
-        scores['Energy'] = self.speech_metrics.calculate_energy_similarity(ref_path, test_path)
+        # 2. Energy 相似度（直接使用已解碼的波形，不再重新讀檔）
+        scores['Energy'] = self.speech_metrics.calculate_energy_similarity(
+            self._to_sound(ref['wav'], ref['sr']),
+            self._to_sound(test['wav'], test['sr'])
+        )
 
         # === 使用模型預測人類評分 (1-5 分) ===
         model_features = {
@@ -112,6 +182,11 @@ class AudioScorer:
 
         return rating
 
+    @staticmethod
+    def _to_sound(wav: torch.Tensor, sr: int) -> parselmouth.Sound:
+        """將 [1, T] 波形轉成 parselmouth.Sound"""
+        return parselmouth.Sound(wav.squeeze(0).double().numpy(), sampling_frequency=sr)
+
     def _calculate_per_similarity(self, ref_phones: list, test_phones: list) -> float:
         """
         計算 PER 相似度 (1 - 音素錯誤率)
@@ -120,28 +195,13 @@ class AudioScorer:
         if not ref_phones:
             return 0.0
 
-        # Levenshtein 距離計算
-        m, n = len(ref_phones), len(test_phones)
-        dp = [[0] * (n + 1) for _ in range(m + 1)]
-
-        for i in range(m + 1):
-            dp[i][0] = i
-        for j in range(n + 1):
-            dp[0][j] = j
-
-        for i in range(1, m + 1):
-            for j in range(1, n + 1):
-                if ref_phones[i - 1] == test_phones[j - 1]:
-                    dp[i][j] = dp[i - 1][j - 1]
-                else:
-                    dp[i][j] = 1 + min(dp[i - 1][j], dp[i][j - 1], dp[i - 1][j - 1])
-
-        edit_distance = dp[m][n]
+        edit_distance = levenshtein(ref_phones, test_phones)
         per = edit_distance / len(ref_phones)
 
         # 轉換為相似度
         return max(0.0, 1.0 - per)
 
+    @torch.inference_mode()
     def _calculate_ppg_similarity(
         self,
         ref_logp: torch.Tensor,
@@ -151,9 +211,9 @@ class AudioScorer:
         計算 PPG 相似度
         使用 cosine similarity
         """
-        # 取平均後驗作為整體表示
-        ref_mean = ref_logp.exp().mean(dim=0)  # [V]
-        test_mean = test_logp.exp().mean(dim=0)  # [V]
+        # 取平均後驗作為整體表示（等比例縮放，cosine 不受影響）
+        ref_mean = self._scaled_mean_posterior(ref_logp)  # [V]
+        test_mean = self._scaled_mean_posterior(test_logp)  # [V]
 
         # Cosine similarity
         cos_sim = torch.nn.functional.cosine_similarity(
@@ -166,36 +226,154 @@ class AudioScorer:
 
         return float(similarity)
 
+    @staticmethod
+    def _scaled_mean_posterior(logp: torch.Tensor) -> torch.Tensor:
+        """
+        在 log 空間對時間取平均後驗，再以最大值平移後取 exp
+
+        logsumexp 不需要先建立 [T, V] 的 exp 中間張量，也不會因 log 機率很小而下溢；
+        結果與 logp.exp().mean(dim=0) 只差一個正的常數倍
+        """
+        log_mean = torch.logsumexp(logp, dim=0) - math.log(logp.size(0))  # [V]
+        return torch.exp(log_mean - log_mean.max())
+
+    @torch.inference_mode()
     def _calculate_gop(
         self,
         ref_logp: torch.Tensor,
-        ref_spans: list,
+        ref_spans: SpanArr,
         test_logp: torch.Tensor,
-        test_spans: list
+        test_spans: SpanArr
     ) -> float:
         """
         計算 GOP-new (Goodness of Pronunciation)
         基於音素片段的平均對數機率
         """
-        if not test_spans:
+        if len(test_spans) == 0:
             return 0.0
 
         # 計算測試音檔每個音素片段的平均對數機率
-        gop_scores = []
-        for pid, start, end in test_spans:
-            # 取該音素在其時間片段內的平均機率
-            segment_logp = test_logp[start:end+1, pid]
-            avg_logp = segment_logp.mean().item()
-            gop_scores.append(avg_logp)
-
-        if not gop_scores:
-            return 0.0
+        # 一次 gather 所有片段的 (幀, 音素) 對數機率，再以 index_add 依片段加總
+        device = test_logp.device
+        pids, starts, ends = (
+            torch.from_numpy(column).to(device)
+            for column in (test_spans.pid, test_spans.t1, test_spans.t2)
+        )
+        lengths = ends - starts + 1
+        segment = torch.repeat_interleave(torch.arange(len(test_spans), device=device), lengths)
+        offsets = torch.arange(segment.numel(), device=device) - (lengths.cumsum(0) - lengths)[segment]
+        frame_logp = test_logp[starts[segment] + offsets, pids[segment]]
+
+        segment_sum = torch.zeros(len(test_spans), dtype=test_logp.dtype, device=device)
+        segment_sum.index_add_(0, segment, frame_logp)
+        gop_scores = segment_sum / lengths
 
         # 平均 GOP 分數，並轉換到 [0, 1]
         # log probability 範圍約 [-10, 0]，我們做簡單的線性轉換
-        mean_gop = sum(gop_scores) / len(gop_scores)
+        mean_gop = gop_scores.mean().item()
 
         # 轉換: -10 -> 0, 0 -> 1
         normalized_gop = max(0.0, min(1.0, (mean_gop + 10.0) / 10.0))
 
         return float(normalized_gop)
+
+
+# 行程內共用的評分器：模型只在第一次使用時載入
+_scorer: Optional[AudioScorer] = None
+_scorer_lock = threading.Lock()
+
+
+def get_scorer() -> AudioScorer:
+    """
+    取得行程內共用的 AudioScorer 單例
+
+    Returns:
+        AudioScorer: 評分器實例（第一次呼叫時才載入模型）
+    """
+    global _scorer
+    if _scorer is None:
+        with _scorer_lock:
+            if _scorer is None:
+                _scorer = AudioScorer()
+    return _scorer
+
+
+# ==================== 跨行程評分 ====================
+# SCORER_PROCESSES > 0 時，評分改在獨立的 process pool 執行：
+# 推論不佔用 Flask/gunicorn 的請求執行緒，並可同時使用多顆 CPU。
+# 每個 worker process 在啟動時建立一次 AudioScorer（模型只載入一次）。
+SCORER_PROCESSES = int(os.getenv('SCORER_PROCESSES', '0'))
+SCORE_TIMEOUT = float(os.getenv('SCORE_TIMEOUT', '120'))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker() -> None:
+    get_scorer()
+
+
+def _score_job(reference_audio: str, test_audio: str) -> float:
+    return get_scorer().score(reference_audio, test_audio)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 使用 spawn 避免 fork 已初始化 CUDA / OpenMP 的行程
+            _pool = ProcessPoolExecutor(
+                max_workers=SCORER_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """丟棄已損壞的 pool，下一次請求時由 _get_pool() 重新建立"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_score(
+    reference_audio: Union[str, Path],
+    test_audio: Union[str, Path]
+) -> float:
+    """
+    計算模型預測評分，依 SCORER_PROCESSES 決定在 process pool 或目前執行緒執行
+
+    Args:
+        reference_audio: 參考音檔路徑
+        test_audio: 要評分的音檔路徑
+
+    Returns:
+        float: 模型預測的人類評分 (1-5 分)
+
+    逾時時會取消該工作，但只有仍在佇列中等待的工作能被取消；
+    已經開始執行的工作會在 worker process 內繼續跑完。
+    worker process 異常結束（例如 OOM）導致 pool 損壞時，會丟棄該 pool，
+    下一次請求再重新建立。
+
+    Raises:
+        concurrent.futures.TimeoutError: pool 評分超過 SCORE_TIMEOUT 秒
+        concurrent.futures.process.BrokenProcessPool: worker process 異常結束
+    """
+    if SCORER_PROCESSES > 0:
+        pool = _get_pool()
+        try:
+            future = pool.submit(_score_job, str(reference_audio), str(test_audio))
+            try:
+                return future.result(timeout=SCORE_TIMEOUT)
+            except FutureTimeoutError:
+                # 避免被放棄的工作在佇列中累積，並在上傳檔 fd 關閉後才開始執行
+                future.cancel()
+                raise
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+
+    return get_scorer().score(reference_audio, test_audio)
@@ -0,0 +1,73 @@
+"""
+編輯距離 (Levenshtein) 工具
+PER / WER 共用，輸入為任意可雜湊元素的序列（音素列表、單字列表）
+
+安裝 rapidfuzz 時使用其 C++ bit-parallel 實作，否則退回純 Python 的 bit-parallel 實作
+"""
+
+from typing import Hashable, Sequence
+
+# Optional dependencies
+try:
+    from rapidfuzz.distance import Levenshtein
+
+    HAS_RAPIDFUZZ = True
+except ImportError:
+    Levenshtein = None
+    HAS_RAPIDFUZZ = False
+
+
+def levenshtein(ref: Sequence[Hashable], hyp: Sequence[Hashable]) -> int:
+    """
+    計算兩個序列的編輯距離（插入、刪除、替換的成本皆為 1）
+
+    Args:
+        ref: 參考序列
+        hyp: 比較序列
+
+    Returns:
+        編輯距離
+
+    Example:
+        >>> levenshtein(['h', 'ə', 'l', 'oʊ'], ['h', 'ɛ', 'l', 'oʊ'])
+        1
+    """
+    if HAS_RAPIDFUZZ:
+        return Levenshtein.distance(ref, hyp)
+    return _levenshtein_bitparallel(ref, hyp)
+
+
+def _levenshtein_bitparallel(ref: Sequence[Hashable], hyp: Sequence[Hashable]) -> int:
+    """
+    Hyyrö 的 bit-parallel Levenshtein（Myers 演算法的編輯距離版本）
+
+    DP 的一整欄以位元向量表示（Python int 不限長度，參考序列超過 64 個元素也適用），
+    每個 hyp 元素只需要常數個位元運算，不需要 O(m·n) 的逐格迴圈
+    """
+    m = len(ref)
+    if m == 0:
+        return len(hyp)
+
+    # 每個元素在 ref 中出現位置的 bitmap
+    peq: dict = {}
+    for i, token in enumerate(ref):
+        peq[token] = peq.get(token, 0) | (1 << i)
+
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    vp, vn, score = mask, 0, m
+    for token in hyp:
+        eq = peq.get(token, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        hp = (vn | ~(xh | vp)) & mask
+        hn = vp & xh
+        if hp & high:
+            score += 1
+        elif hn & high:
+            score -= 1
+        hp = ((hp << 1) | 1) & mask
+        hn = (hn << 1) & mask
+        vp = (hn | ~(xv | hp)) & mask
+        vn = hp & xv
+    return score
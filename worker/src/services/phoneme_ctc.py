@@ -3,11 +3,22 @@
 使用 wav2vec2 進行音素級別的語音辨識
 """
 
-from typing import Optional
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
 import torch
 import torchaudio
 from torch.nn import functional as F
 
+from services.audio_io import load_waveform
+
 # Optional dependencies
 try:
     from transformers import (
@@ -24,6 +35,42 @@ except ImportError:
     Wav2Vec2Processor = None
     HAS_TRANSFORMERS = False
 
+# Posteriorgram 快取：同一段參考音檔只需要跑一次 wav2vec2
+PPG_CACHE_DIR = Path(__file__).resolve().parents[2] / "temp" / "cache" / "ppg"
+PPG_MEMORY_CACHE_SIZE = 128
+# spans 的解碼方式或儲存格式改變時遞增，讓舊的磁碟快取失效
+PPG_CACHE_VERSION = 4
+
+# calculate_*_similarity 未傳入 ctc 時共用的預設模型，只載入一次
+_DEFAULT_CTC: Optional["PhoneCTC"] = None
+_DEFAULT_CTC_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class SpanArr:
+    """
+    音素片段列表的欄位式表示 (structure of arrays)
+
+    三個等長的 int64 陣列，第 i 個片段為 (pid[i], t1[i], t2[i])；
+    GOP / DTW 等下游計算可以直接對整個欄位做向量運算
+    """
+
+    pid: np.ndarray  # 音素 ID
+    t1: np.ndarray  # 起始幀
+    t2: np.ndarray  # 結束幀（包含）
+
+    def __len__(self) -> int:
+        return int(self.pid.shape[0])
+
+    @classmethod
+    def empty(cls) -> "SpanArr":
+        none = np.zeros(0, dtype=np.int64)
+        return cls(none, none, none)
+
+    def to_list(self) -> list[tuple[int, int, int]]:
+        """轉回 [(phoneme_id, start_frame, end_frame), ...]"""
+        return list(zip(self.pid.tolist(), self.t1.tolist(), self.t2.tolist()))
+
 
 class PhoneCTC:
     """
@@ -62,6 +109,7 @@ class PhoneCTC:
                 "Install with: pip install transformers"
             )
 
+        self.model_name = model_name
         self.processor = self._load_processor(model_name)
         self.model = AutoModelForCTC.from_pretrained(model_name).eval()
         self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -78,6 +126,10 @@ class PhoneCTC:
 
         self.id2tok = {i: t for t, i in self.processor.tokenizer.get_vocab().items()}
 
+        # 以 (路徑, 大小, mtime) 為 key 的記憶體 LRU，每個實例各自一份
+        self._memory_cache: OrderedDict = OrderedDict()
+        self._memory_lock = threading.Lock()
+
     def _load_processor(self, model_name: str):
         """
         Instantiate the processor with robust fallbacks.
@@ -111,7 +163,7 @@ class PhoneCTC:
     @torch.inference_mode()
     def posteriors_and_spans(
         self, wav: torch.Tensor, sr: int
-    ) -> tuple[torch.Tensor, list[tuple[int, int, int]]]:
+    ) -> tuple[torch.Tensor, SpanArr]:
         """
         計算音素後驗機率和音素片段
 
@@ -121,14 +173,66 @@ class PhoneCTC:
 
         Returns:
             logp: Log-posteriorgram [T, V]，每個時間步的音素機率分佈
-            spans: List of (phoneme_id, start_frame, end_frame)，音素片段列表
+            spans: 音素片段 SpanArr (phoneme_id, start_frame, end_frame)
 
         Example:
             >>> wav, sr = torchaudio.load("hello.wav")
             >>> logp, spans = ctc.posteriors_and_spans(wav, sr)
-            >>> # spans: [(5, 10, 15), (23, 16, 22), ...]
-            >>> #          (音素ID, 起始幀, 結束幀)
+            >>> # spans.to_list(): [(5, 10, 15), (23, 16, 22), ...]
+            >>> #                   (音素ID, 起始幀, 結束幀)
         """
+        wav = self._prepare_waveform(wav, sr)
+
+        # 提取特徵並計算 logits
+        inp = self.processor(wav.numpy(), sampling_rate=self.sr, return_tensors="pt")
+        logits = self.model(inp.input_values.to(self.device)).logits.squeeze(0)
+        logp = F.log_softmax(logits, dim=-1).cpu()  # [T, V]
+
+        return logp, self._spans_from_logp(logp)
+
+    @torch.inference_mode()
+    def posteriors_and_spans_batch(
+        self, wavs: list[torch.Tensor], srs: list[int]
+    ) -> list[tuple[torch.Tensor, SpanArr]]:
+        """
+        一次 forward 計算多段音訊的 posteriorgram 與 spans
+
+        各段補零到相同長度並傳入 attention_mask，輸出再依各自的實際幀數截斷，
+        結果與逐段呼叫 posteriors_and_spans 相同
+
+        Args:
+            wavs: 音訊波形列表，每段 [1, T] 或 [T]
+            srs: 對應的採樣率列表
+
+        Returns:
+            每段音訊的 (logp, spans)，順序與輸入相同
+        """
+        arrays = [self._prepare_waveform(wav, sr).numpy() for wav, sr in zip(wavs, srs)]
+
+        # processor 負責補零、逐段正規化並產生 attention_mask
+        inp = self.processor(
+            arrays,
+            sampling_rate=self.sr,
+            padding=True,
+            return_attention_mask=True,
+            return_tensors="pt",
+        )
+        logits = self.model(
+            inp.input_values.to(self.device, non_blocking=True),
+            attention_mask=inp.attention_mask.to(self.device, non_blocking=True),
+        ).logits
+        logp_batch = F.log_softmax(logits, dim=-1).cpu()  # [B, T_max, V]
+
+        # 去掉補零部分對應的輸出幀
+        num_frames = self.model._get_feat_extract_output_lengths(inp.attention_mask.sum(-1))
+        results = []
+        for logp, n in zip(logp_batch, num_frames.tolist()):
+            logp = logp[: int(n)]
+            results.append((logp, self._spans_from_logp(logp)))
+        return results
+
+    def _prepare_waveform(self, wav: torch.Tensor, sr: int) -> torch.Tensor:
+        """轉為單聲道 [T] 並重採樣到模型要求的採樣率"""
         # 確保單聲道
         if wav.dim() == 2:
             wav = wav.mean(0, keepdim=True)
@@ -137,61 +241,189 @@ class PhoneCTC:
         if sr != self.sr:
             wav = torchaudio.functional.resample(wav, sr, self.sr)
 
-        # 提取特徵並計算 logits
-        inp = self.processor(
-            wav.squeeze(0).cpu().numpy(), sampling_rate=self.sr, return_tensors="pt"
+        return wav.reshape(-1).cpu()
+
+    def _spans_from_logp(self, logp: torch.Tensor) -> SpanArr:
+        """
+        CTC greedy 解碼，回傳每個音素的 (phoneme_id, start_frame, end_frame)
+        """
+        ids = logp.argmax(dim=-1).numpy()
+        if ids.size == 0:
+            return SpanArr.empty()
+
+        # 在保留 blank 的原始序列上找出 id 連續相同的段落，再丟掉 blank 段；
+        # 被 blank 隔開的重複音素（例如 [a, blank, a]）因此仍是兩個音素，與標準 CTC collapse 一致
+        run_starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        run_ends = np.r_[run_starts[1:] - 1, ids.size - 1]
+        keep = ids[run_starts] != self.blank
+
+        return SpanArr(
+            pid=ids[run_starts[keep]].astype(np.int64),
+            t1=run_starts[keep].astype(np.int64),
+            t2=run_ends[keep].astype(np.int64),
         )
-        logits = self.model(inp.input_values.to(self.device)).logits.squeeze(0)
-        logp = F.log_softmax(logits, dim=-1).cpu()  # [T, V]
 
-        # CTC 解碼：移除 blank 和重複
-        ids = torch.argmax(logp, dim=-1).tolist()
-        spans: list[tuple[int, int, int]] = []
-        collapsed: list[int] = []
-        prev = None
+    def cached_posteriors_and_spans(
+        self, path: Union[str, Path]
+    ) -> tuple[torch.Tensor, SpanArr]:
+        """
+        讀取音檔並計算 posteriorgram 與 spans，結果依檔案內容快取
+
+        先查記憶體 LRU，再查磁碟上的 .npz（PPG_CACHE_DIR），都沒有才執行模型；
+        檔案被修改（大小或 mtime 改變）時會自動重新計算，/proc/ 下的上傳檔則不快取
+
+        Args:
+            path: 音檔路徑
+
+        Returns:
+            同 posteriors_and_spans 的 (logp, spans)；logp 可能與其他呼叫共用，請勿原地修改
+        """
+        key = self._file_key(path)
+        if key is None:
+            return self.posteriors_and_spans(*load_waveform(path))
+
+        cached = self._memory_get(key)
+        if cached is None:
+            cached = self._load_or_compute_posteriors(*key)
+            self._memory_put(key, cached)
+        return cached
+
+    def cached_posteriors_and_spans_batch(
+        self, paths: list[Union[str, Path]]
+    ) -> list[tuple[torch.Tensor, SpanArr]]:
+        """
+        同 cached_posteriors_and_spans，但沒有快取的音檔會合併成一次 forward 計算
+
+        Args:
+            paths: 音檔路徑列表
 
-        for pid in ids:
-            if pid == self.blank:
-                prev = pid
+        Returns:
+            每個音檔的 (logp, spans)，順序與輸入相同
+        """
+        keys = [self._file_key(path) for path in paths]
+
+        # 依序查記憶體 LRU、磁碟快取，兩者都沒有（或不可快取）的才送進模型
+        results: list[Optional[tuple[torch.Tensor, SpanArr]]] = []
+        for key in keys:
+            if key is None:
+                results.append(None)
                 continue
-            if pid != prev:
-                collapsed.append(pid)
-            prev = pid
-
-        # 找出每個音素的 span
-        if collapsed:
-            j = 0
-            cur = collapsed[0]
-            start = None
-            for t, pid in enumerate(ids):
-                if pid == self.blank:
-                    continue
-                if start is None and pid == cur:
-                    start = t
-                    last = t
-                elif start is not None and pid == cur:
-                    last = t
-                elif start is not None and pid != cur:
-                    spans.append((cur, start, last))
-                    j += 1
-                    if j >= len(collapsed):
-                        break
-                    cur = collapsed[j]
-                    start = t
-                    last = t
-
-            # 處理最後一個音素
-            if start is not None and j < len(collapsed):
-                spans.append((cur, start, last))
+            cached = self._memory_get(key)
+            if cached is None:
+                cached = self._read_cache(self._cache_file(*key))
+                if cached is not None:
+                    self._memory_put(key, cached)
+            results.append(cached)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            loaded = [load_waveform(paths[i]) for i in missing]
+            computed = self.posteriors_and_spans_batch(
+                [wav for wav, _ in loaded], [sr for _, sr in loaded]
+            )
+            for i, result in zip(missing, computed):
+                if keys[i] is not None:
+                    self._write_cache(self._cache_file(*keys[i]), *result)
+                    self._memory_put(keys[i], result)
+                results[i] = result
+
+        return results
+
+    def _memory_get(self, key: tuple[str, int, int]) -> Optional[tuple[torch.Tensor, SpanArr]]:
+        with self._memory_lock:
+            cached = self._memory_cache.get(key)
+            if cached is not None:
+                self._memory_cache.move_to_end(key)
+            return cached
+
+    def _memory_put(
+        self, key: tuple[str, int, int], value: tuple[torch.Tensor, SpanArr]
+    ) -> None:
+        with self._memory_lock:
+            self._memory_cache[key] = value
+            self._memory_cache.move_to_end(key)
+            while len(self._memory_cache) > PPG_MEMORY_CACHE_SIZE:
+                self._memory_cache.popitem(last=False)
+
+    @staticmethod
+    def _file_key(path: Union[str, Path]) -> Optional[tuple[str, int, int]]:
+        """
+        快取 key：(絕對路徑, 檔案大小, mtime_ns)；不可快取時回傳 None
 
+        /proc/<pid>/fd/<n> 形式的上傳檔 (O_TMPFILE) 不快取：fd 編號會被之後的上傳重複使用，
+        路徑、大小與 mtime 都可能相同，當作 key 會把上一個上傳檔的結果回傳給下一個；
+        這類檔案也不會再被讀到第二次，寫入磁碟快取只會讓快取目錄無限成長
+        """
+        path = str(path)
+        if path.startswith("/proc/"):
+            return None
+        path = str(Path(path).resolve())
+        stat = os.stat(path)
+        return path, stat.st_size, stat.st_mtime_ns
+
+    def _cache_file(self, path: str, size: int, mtime_ns: int) -> Path:
+        key = hashlib.sha1(f"v{PPG_CACHE_VERSION}|{self.model_name}|{path}|{size}|{mtime_ns}".encode()).hexdigest()
+        return PPG_CACHE_DIR / f"{key}.npz"
+
+    def _load_or_compute_posteriors(
+        self, path: str, size: int, mtime_ns: int
+    ) -> tuple[torch.Tensor, SpanArr]:
+        """從磁碟快取讀取 (logp, spans)，不存在時計算並寫入"""
+        cache_file = self._cache_file(path, size, mtime_ns)
+
+        cached = self._read_cache(cache_file)
+        if cached is not None:
+            return cached
+
+        logp, spans = self.posteriors_and_spans(*load_waveform(path))
+        self._write_cache(cache_file, logp, spans)
         return logp, spans
 
-    def phones_from_spans(self, spans: list[tuple[int, int, int]]) -> list[str]:
+    @staticmethod
+    def _read_cache(cache_file: Path) -> Optional[tuple[torch.Tensor, SpanArr]]:
+        """讀取磁碟快取，不存在或損毀時回傳 None"""
+        if not cache_file.exists():
+            return None
+        try:
+            with np.load(cache_file) as data:
+                logp = torch.from_numpy(data["logp"])
+                spans = SpanArr(data["pid"], data["t1"], data["t2"])
+            return logp, spans
+        except (OSError, ValueError, KeyError):
+            return None  # 快取檔損毀，重新計算
+
+    @staticmethod
+    def _write_cache(
+        cache_file: Path, logp: torch.Tensor, spans: SpanArr
+    ) -> None:
+        # 先寫入暫存檔再 rename，避免其他 process 讀到寫一半的檔案；
+        # 暫存檔名每次呼叫都不同，同一 process 內多個 request thread 快取同一音檔也不會互相覆蓋
+        # 寫入失敗只代表下次要重新計算，不影響這次已算好的結果
+        try:
+            PPG_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=PPG_CACHE_DIR, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(
+                        f,
+                        logp=logp.float().numpy(),
+                        pid=spans.pid,
+                        t1=spans.t1,
+                        t2=spans.t2,
+                    )
+                os.replace(tmp_name, cache_file)
+            except BaseException:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+        except OSError as e:
+            print(f"Warning: 無法寫入 posteriorgram 快取 {cache_file.name} ({e})")
+
+    def phones_from_spans(self, spans: SpanArr) -> list[str]:
         """
         從 spans 提取音素符號列表
 
         Args:
-            spans: List of (phoneme_id, start_frame, end_frame)
+            spans: 音素片段 SpanArr
 
         Returns:
             音素符號列表，例如 ['h', 'ɛ', 'l', 'oʊ']
@@ -201,4 +433,22 @@ class PhoneCTC:
             >>> phones = ctc.phones_from_spans(spans)
             >>> print(' '.join(phones))  # 'h ɛ l oʊ'
         """
-        return [self.id2tok.get(int(pid), "") for pid, _, _ in spans]
+        return [self.id2tok.get(pid, "") for pid in spans.pid.tolist()]
+
+
+def get_default_ctc() -> PhoneCTC:
+    """
+    取得共用的預設 PhoneCTC 實例（第一次呼叫時載入模型）
+
+    同一個實例也共用 posteriorgram 的記憶體 LRU，重複出現的參考音檔不必重新推論
+
+    Returns:
+        預設模型的 PhoneCTC 實例
+    """
+    global _DEFAULT_CTC
+    if _DEFAULT_CTC is None:
+        with _DEFAULT_CTC_LOCK:
+            # 在鎖內再檢查一次，避免多個 request thread 同時載入模型
+            if _DEFAULT_CTC is None:
+                _DEFAULT_CTC = PhoneCTC()
+    return _DEFAULT_CTC
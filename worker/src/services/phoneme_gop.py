@@ -4,21 +4,55 @@ GOP (Goodness of Pronunciation) 相似度計算
 """
 
 import math
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Union
 
 import numpy as np
 import torch
-import torchaudio
+from numba import njit
 
-from .phoneme_ctc import PhoneCTC
+from .phoneme_ctc import PhoneCTC, SpanArr, get_default_ctc
+from .phoneme_per import _calc_per
+
+# short_circuit 的門檻：音素序列差異大到 GOP 比較沒有意義時直接回傳 0
+SHORT_CIRCUIT_MAX_PER = 0.8
+SHORT_CIRCUIT_MAX_LENGTH_DIFF = 0.5
+
+
+@dataclass(frozen=True)
+class GopArr:
+    """
+    GOP 序列的欄位式表示 (structure of arrays)
+
+    三個等長陣列，第 i 個音素為 (pid[i], g[i], dur[i])，可直接傳入 numba 的 DTW kernel
+    """
+
+    pid: np.ndarray  # 音素 ID (int64)
+    g: np.ndarray  # 平均 GOP 分數 (float64，越高越好)
+    dur: np.ndarray  # 音素持續時間，幀數 (int64)
+
+    def __len__(self) -> int:
+        return int(self.pid.shape[0])
+
+    @classmethod
+    def empty(cls) -> "GopArr":
+        return cls(
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float64),
+            np.zeros(0, dtype=np.int64),
+        )
+
+    def to_list(self) -> list[tuple[int, float, int]]:
+        """轉回 [(phoneme_id, gop_score, duration), ...]"""
+        return list(zip(self.pid.tolist(), self.g.tolist(), self.dur.tolist()))
 
 
 def _gops_from_spans(
     logp: torch.Tensor,
-    spans: list[tuple[int, int, int]],
+    spans: SpanArr,
     blank_id: int,
-) -> list[tuple[int, float, int]]:
+) -> GopArr:
     """
     從音素 spans 計算 GOP (Goodness of Pronunciation) 分數
 
@@ -26,11 +60,11 @@ def _gops_from_spans(
 
     Args:
         logp: Log-posteriorgram [T, V]
-        spans: List of (phoneme_id, start_frame, end_frame)
+        spans: 音素片段 SpanArr (phoneme_id, start_frame, end_frame)
         blank_id: Blank token ID
 
     Returns:
-        List of (phoneme_id, gop_score, duration)
+        GopArr (phoneme_id, gop_score, duration)，超出 logp 範圍的片段會被略過
         - phoneme_id: 音素 ID
         - gop_score: 平均 GOP 分數 (越高越好)
         - duration: 音素持續時間 (幀數)
@@ -38,38 +72,96 @@ def _gops_from_spans(
     Example:
         >>> logp, spans = ctc.posteriors_and_spans(wav, sr)
         >>> gops = _gops_from_spans(logp, spans, ctc.blank)
-        >>> # gops: [(5, 1.2, 10), (23, 0.8, 15), ...]
-        >>> #         (音素ID, GOP分數, 持續時間)
+        >>> # gops.to_list(): [(5, 1.2, 10), (23, 0.8, 15), ...]
+        >>> #                  (音素ID, GOP分數, 持續時間)
     """
     T, V = logp.shape
-    out: list[tuple[int, float, int]] = []
+    valid = (spans.t1 >= 0) & (spans.t1 <= spans.t2) & (spans.t2 < T)
+    if not valid.any():
+        return GopArr.empty()
+    pid_col = spans.pid[valid]
+    dur_col = spans.t2[valid] - spans.t1[valid] + 1
+
+    # 每一幀排除 blank 後的前兩名：正確音素若是第一名，最大競爭者就是第二名
+    masked = logp.clone()
+    if 0 <= blank_id < V:
+        masked[:, blank_id] = float("-inf")
+    top_vals, top_idx = masked.topk(2, dim=-1)  # [T, 2]
+
+    # 把所有 span 展開成逐幀索引，一次算完全部幀的 GOP
+    pids = torch.from_numpy(pid_col)
+    starts = torch.from_numpy(spans.t1[valid])
+    durs = torch.from_numpy(dur_col)
+
+    seg_ids = torch.repeat_interleave(torch.arange(len(pid_col)), durs)
+    offsets = torch.cumsum(durs, 0) - durs
+    frames = starts[seg_ids] + torch.arange(int(durs.sum())) - offsets[seg_ids]
+    frame_pids = pids[seg_ids]
+
+    # GOP: log P(correct) - max(log P(competitor))
+    lp = logp[frames, frame_pids]  # 正確音素的 log-prob
+    comp = torch.where(
+        top_idx[frames, 0] == frame_pids, top_vals[frames, 1], top_vals[frames, 0]
+    )  # 最大競爭者
+
+    # 各 span 的平均 GOP
+    sums = logp.new_zeros(len(pid_col)).index_add_(0, seg_ids, lp - comp)
+    gops = (sums / durs.to(logp.dtype)).double().numpy()
+
+    return GopArr(pid=pid_col, g=gops, dur=dur_col)
+
+
+@njit(cache=True)
+def _dtw_phone_cost(pids_a, gs_a, ds_a, pids_b, gs_b, ds_b, lam, band):
+    """
+    同音素 DTW 的累積成本（band < 0 表示全局對齊）
 
-    for pid, t1, t2 in spans:
-        if t1 > t2 or t1 < 0 or t2 >= T:
-            continue
+    只需要最終成本、不需要回溯路徑，保留兩列即可 (O(m) 記憶體)
+    """
+    n = pids_a.shape[0]
+    m = pids_b.shape[0]
+    prev = np.full(m + 1, np.inf, dtype=np.float32)
+    curr = np.empty(m + 1, dtype=np.float32)
+    prev[0] = 0.0
 
-        # 提取該音素的片段
-        seg = logp[t1 : t2 + 1, :]  # [duration, V]
+    for i in range(1, n + 1):
+        curr[:] = np.inf
 
-        # GOP: log P(correct) - max(log P(competitor))
-        lp = seg[:, pid]  # 正確音素的 log-prob
-        mask = torch.ones(V, dtype=torch.bool)
-        mask[pid] = False
-        if 0 <= blank_id < V:
-            mask[blank_id] = False
+        # 限制 j 的範圍 (band constraint)
+        jmin = 1
+        jmax = m
+        if band >= 0:
+            jmin = max(1, i - band)
+            jmax = min(m, i + band)
 
-        comp = torch.max(seg[:, mask], dim=-1).values  # 最大競爭者
-        g = (lp - comp).mean().item()  # 平均 GOP
-        dur = t2 - t1 + 1
+        for j in range(jmin, jmax + 1):
+            if pids_a[i - 1] == pids_b[j - 1]:
+                # 相同音素：比較 GOP 分數和持續時間
+                cost = abs(gs_a[i - 1] - gs_b[j - 1]) + lam * abs(ds_a[i - 1] - ds_b[j - 1])
+            else:
+                # 不同音素：高懲罰
+                cost = 1.5
 
-        out.append((int(pid), float(g), int(dur)))
+            curr[j] = min(prev[j] + 0.5, curr[j - 1] + 0.5, prev[j - 1] + cost)
 
-    return out
+        prev, curr = curr, prev
+
+    return prev[m]
+
+
+# 在 import 時編譯（或從 numba 的磁碟快取載入），第一個請求不必承擔 JIT 時間
+_WARMUP_GOPS = GopArr(np.zeros(1, np.int64), np.zeros(1, np.float64), np.ones(1, np.int64))
+_dtw_phone_cost(
+    _WARMUP_GOPS.pid, _WARMUP_GOPS.g, _WARMUP_GOPS.dur,
+    _WARMUP_GOPS.pid, _WARMUP_GOPS.g, _WARMUP_GOPS.dur,
+    0.01, -1,
+)
+del _WARMUP_GOPS
 
 
 def _dtw_phone(
-    gops_a: list[tuple[int, float, int]],
-    gops_b: list[tuple[int, float, int]],
+    gops_a: GopArr,
+    gops_b: GopArr,
     tau: float = 1.0,
     lam: float = 0.01,
     band: Optional[int] = None,
@@ -91,39 +183,32 @@ def _dtw_phone(
         相似度分數 [0, 1]
 
     Example:
-        >>> gops_a = [(5, 1.2, 10), (23, 0.8, 15)]
-        >>> gops_b = [(5, 1.0, 12), (23, 0.9, 14)]
+        >>> gops_a = _gops_from_spans(logp_a, spans_a, ctc.blank)
+        >>> gops_b = _gops_from_spans(logp_b, spans_b, ctc.blank)
         >>> sim = _dtw_phone(gops_a, gops_b)
         >>> print(f"Similarity: {sim:.4f}")
     """
-    if not gops_a or not gops_b:
+    if len(gops_a) == 0 or len(gops_b) == 0:
         return 0.0
 
-    n, m = len(gops_a), len(gops_b)
-    D = np.full((n + 1, m + 1), np.inf, dtype=np.float32)
-    D[0, 0] = 0.0
-
-    for i in range(1, n + 1):
-        pid_i, gi, di = gops_a[i - 1]
-
-        # 限制 j 的範圍 (band constraint)
-        jmin = 1 if band is None else max(1, i - band)
-        jmax = m if band is None else min(m, i + band)
-
-        for j in range(jmin, jmax + 1):
-            pid_j, gj, dj = gops_b[j - 1]
+    # DP 迴圈在 numba 編譯的 kernel 中直接讀取 GopArr 的欄位
+    cost = _dtw_phone_cost(
+        gops_a.pid, gops_a.g, gops_a.dur,
+        gops_b.pid, gops_b.g, gops_b.dur,
+        lam, -1 if band is None else band,
+    )
 
-            if pid_i == pid_j:
-                # 相同音素：比較 GOP 分數和持續時間
-                cost = abs(gi - gj) + lam * abs(di - dj)
-            else:
-                # 不同音素：高懲罰
-                cost = 1.5
+    dist = cost / (len(gops_a) + len(gops_b))
+    return float(math.exp(-dist / tau))
 
-            D[i, j] = min(D[i - 1, j] + 0.5, D[i, j - 1] + 0.5, D[i - 1, j - 1] + cost)
 
-    dist = D[n, m] / (n + m)
-    return float(math.exp(-dist / tau))
+def _phones_differ_widely(spans_a: SpanArr, spans_b: SpanArr) -> bool:
+    """以 B 為參考，判斷兩段音素序列的長度或 PER 是否差異過大"""
+    n_a, n_b = len(spans_a), len(spans_b)
+    if abs(n_a - n_b) / max(n_b, 1) > SHORT_CIRCUIT_MAX_LENGTH_DIFF:
+        return True
+    # 直接比較音素 ID，不需要轉成音素符號
+    return _calc_per(spans_b.pid.tolist(), spans_a.pid.tolist()) > SHORT_CIRCUIT_MAX_PER
 
 
 def calculate_gop_similarity(
@@ -134,6 +219,7 @@ def calculate_gop_similarity(
     lambda_duration: float = 0.01,
     band: Optional[int] = None,
     downsample: int = 3,
+    short_circuit: bool = True,
 ) -> float:
     """
     計算兩段語音的 GOP 相似度
@@ -144,7 +230,7 @@ def calculate_gop_similarity(
     Args:
         audio_a_path: 音檔 A 路徑
         audio_b_path: 音檔 B 路徑
-        ctc: PhoneCTC 實例 (可選，重用以節省載入時間)
+        ctc: PhoneCTC 實例 (可選，預設使用共用的 get_default_ctc())
         tau: 溫度參數，控制距離敏感度 (預設 1.0)
         lambda_duration: 持續時間差異權重 (預設 0.01)
         band: DTW band constraint (預設 None = 全局對齊)
@@ -154,6 +240,10 @@ def calculate_gop_similarity(
             - 1: 不下採樣 (最準確，但慢)
             - 3: 推薦值 (4-5x 加速，準確度損失 < 3%)
             - 5: 最快 (約 5x 加速)
+        short_circuit: 音素序列明顯不同時跳過 GOP / DTW，直接回傳 0.0 (預設 True)
+            - 以 B 為參考，PER > SHORT_CIRCUIT_MAX_PER，
+              或音素數差異 > SHORT_CIRCUIT_MAX_LENGTH_DIFF 時觸發
+            - PER 由同一次 forward 的 spans 計算，不需要額外推論
 
     Returns:
         相似度分數 [0, 1]
@@ -181,27 +271,29 @@ def calculate_gop_similarity(
     """
     # 初始化 CTC 模型
     if ctc is None:
-        ctc = PhoneCTC()
-
-    # 載入音檔
-    wav_a, sr_a = torchaudio.load(str(audio_a_path))
-    wav_b, sr_b = torchaudio.load(str(audio_b_path))
+        ctc = get_default_ctc()
 
     # 獲取音素 posteriorgrams 和 spans
-    logp_a, spans_a = ctc.posteriors_and_spans(wav_a, sr_a)
-    logp_b, spans_b = ctc.posteriors_and_spans(wav_b, sr_b)
+    # 依音檔內容快取，參考音檔不必重複推論；兩段都沒有快取時合併成一次 forward
+    (logp_a, spans_a), (logp_b, spans_b) = ctc.cached_posteriors_and_spans_batch(
+        [audio_a_path, audio_b_path]
+    )
 
     # 空序列/全靜音保護
     if logp_a.size(0) < 5 or logp_b.size(0) < 5:
         return 0.0  # posteriorgram 太短，無法可靠評估
 
+    # 可選：音素序列差異過大時，GOP 與 DTW 的結果沒有參考價值，直接視為不相似
+    if short_circuit and _phones_differ_widely(spans_a, spans_b):
+        return 0.0
+
     # 可選：下採樣 posteriorgram 以平滑 GOP 並加速
     if downsample > 1:
         logp_a = logp_a[::downsample]
         logp_b = logp_b[::downsample]
         # 同步縮放 spans 的時間索引
-        spans_a = [(pid, t1 // downsample, t2 // downsample) for pid, t1, t2 in spans_a]
-        spans_b = [(pid, t1 // downsample, t2 // downsample) for pid, t1, t2 in spans_b]
+        spans_a = SpanArr(spans_a.pid, spans_a.t1 // downsample, spans_a.t2 // downsample)
+        spans_b = SpanArr(spans_b.pid, spans_b.t1 // downsample, spans_b.t2 // downsample)
 
     # 計算 GOP 分數
     gops_a = _gops_from_spans(logp_a, spans_a, ctc.blank)
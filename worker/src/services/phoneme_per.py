@@ -6,9 +6,8 @@ PER (Phoneme Error Rate) 相似度計算
 from pathlib import Path
 from typing import Optional, Union
 
-import torchaudio
-
-from .phoneme_ctc import PhoneCTC
+from .edit_distance import levenshtein
+from .phoneme_ctc import PhoneCTC, get_default_ctc
 
 
 def _calc_per(ref: list[str], hyp: list[str]) -> float:
@@ -16,6 +15,7 @@ def _calc_per(ref: list[str], hyp: list[str]) -> float:
     計算音素錯誤率 (Phoneme Error Rate)
 
     使用編輯距離 (Levenshtein Distance) 計算兩個音素序列的差異
+    （rapidfuzz 的 C++ bit-parallel 實作，未安裝時退回純 Python 實作）
 
     Args:
         ref: 參考音素序列
@@ -30,25 +30,10 @@ def _calc_per(ref: list[str], hyp: list[str]) -> float:
         >>> per = _calc_per(ref, hyp)
         >>> print(f"PER: {per:.2f}")  # PER: 0.25 (1/4)
     """
-    n, m = len(ref), len(hyp)
-    if n == 0:
+    if len(ref) == 0:
         return 0.0
 
-    # 動態規劃計算編輯距離
-    dp = [[0] * (m + 1) for _ in range(n + 1)]
-    for i in range(n + 1):
-        dp[i][0] = i
-    for j in range(m + 1):
-        dp[0][j] = j
-
-    for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            if ref[i - 1] == hyp[j - 1]:
-                dp[i][j] = dp[i - 1][j - 1]
-            else:
-                dp[i][j] = 1 + min(dp[i - 1][j], dp[i][j - 1], dp[i - 1][j - 1])
-
-    return dp[n][m] / n
+    return levenshtein(ref, hyp) / len(ref)
 
 
 def calculate_per_similarity(
@@ -65,7 +50,7 @@ def calculate_per_similarity(
     Args:
         audio_a_path: 音檔 A 路徑
         audio_b_path: 音檔 B 路徑
-        ctc: PhoneCTC 實例 (可選，重用以節省載入時間)
+        ctc: PhoneCTC 實例 (可選，預設使用共用的 get_default_ctc())
 
     Returns:
         相似度分數 [0, 1]
@@ -92,15 +77,13 @@ def calculate_per_similarity(
     """
     # 初始化 CTC 模型
     if ctc is None:
-        ctc = PhoneCTC()
-
-    # 載入音檔
-    wav_a, sr_a = torchaudio.load(str(audio_a_path))
-    wav_b, sr_b = torchaudio.load(str(audio_b_path))
+        ctc = get_default_ctc()
 
     # 獲取音素序列
-    _, spans_a = ctc.posteriors_and_spans(wav_a, sr_a)
-    _, spans_b = ctc.posteriors_and_spans(wav_b, sr_b)
+    # 依音檔內容快取，參考音檔不必重複推論；兩段都沒有快取時合併成一次 forward
+    (_, spans_a), (_, spans_b) = ctc.cached_posteriors_and_spans_batch(
+        [audio_a_path, audio_b_path]
+    )
 
     phones_a = ctc.phones_from_spans(spans_a)
     phones_b = ctc.phones_from_spans(spans_b)
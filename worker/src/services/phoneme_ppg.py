@@ -3,14 +3,18 @@ PPG (Posteriorgram) 相似度計算
 基於 frame-level posteriorgram 的 JSD + DTW 發音相似度評估
 """
 
+import functools
 from pathlib import Path
 from typing import Optional, Union
 
 import numpy as np
 import torch
-import torchaudio
+from numba import njit, prange
 
-from .phoneme_ctc import PhoneCTC
+from .phoneme_ctc import PhoneCTC, get_default_ctc
+
+# 兩段 posteriorgram 長度比例超過此值時，對齊已無意義，直接視為不相似
+PPG_MAX_LENGTH_RATIO = 3.0
 
 
 def _jsd_divergence(p: np.ndarray, q: np.ndarray, eps: float = 1e-12) -> float:
@@ -39,12 +43,117 @@ def _jsd_divergence(p: np.ndarray, q: np.ndarray, eps: float = 1e-12) -> float:
     return float(0.5 * (kl_pm + kl_qm))
 
 
-def _dtw_distance(D: np.ndarray) -> float:
+@functools.lru_cache(maxsize=None)
+def _noblank_index(vocab_size: int, blank_id: int) -> torch.Tensor:
+    """除了 blank 以外的類別索引 [V-1]，每組 (V, blank_id) 只建立一次"""
+    return torch.cat([torch.arange(0, blank_id), torch.arange(blank_id + 1, vocab_size)])
+
+
+def _downsample_logp(logp: torch.Tensor, factor: int) -> torch.Tensor:
+    """
+    在時間軸上以平均池化下採樣 log-posteriorgram
+
+    每 factor 幀的機率分佈取平均（而非只取第一幀），保留被丟棄幀的資訊；
+    尾端不足 factor 的幀也保留 (ceil_mode)，結果重新歸一化為 log 機率
+
+    Args:
+        logp: 已歸一化的 log 機率 [T, V]
+        factor: 下採樣因子
+
+    Returns:
+        下採樣後的 log 機率 [ceil(T / factor), V]
+    """
+    probs = logp.exp().T.unsqueeze(0)  # [1, V, T]
+    pooled = torch.nn.functional.avg_pool1d(probs, kernel_size=factor, stride=factor, ceil_mode=True)
+    logp_pooled = pooled.squeeze(0).T.clamp_min(1e-30).log()
+    return logp_pooled - torch.logsumexp(logp_pooled, dim=1, keepdim=True)
+
+
+@njit(cache=True)
+def _band_range(i, m, band):
+    """第 i 列 (1-based) 在 Sakoe-Chiba band 內的欄位範圍 [j0, j1]；band < 0 表示不限制"""
+    if band < 0:
+        return 1, m
+    return max(1, i - band), min(m, i + band)
+
+
+@njit(cache=True)
+def _dtw_cost(D, band):
+    """
+    DTW 累積成本，只保留兩列 (O(m) 記憶體)
+
+    band >= 0 時每列只計算 band 內的格子 (O(n·band) 運算)，band 外視為無法到達 (inf)
+    不使用 fastmath：無法到達的格子以 inf 表示，fastmath 會假設沒有 inf
+    """
+    n, m = D.shape
+    prev = np.full(m + 1, np.inf, dtype=np.float32)
+    # band 右側從未寫入的格子必須是 inf，因此兩列都以 inf 初始化
+    curr = np.full(m + 1, np.inf, dtype=np.float32)
+    prev[0] = 0.0
+
+    for i in range(1, n + 1):
+        j0, j1 = _band_range(i, m, band)
+        if j0 > j1:
+            curr[:] = np.inf  # 這一列沒有 band 內的格子
+        else:
+            # band 左右邊界外各放一個 inf，擋住上一輪殘留的值
+            curr[j0 - 1] = np.inf
+            for j in range(j0, j1 + 1):
+                # min(上, 左, 左上)
+                best = prev[j] if prev[j] < curr[j - 1] else curr[j - 1]
+                best = best if best < prev[j - 1] else prev[j - 1]
+                curr[j] = D[i - 1, j - 1] + best
+            if j1 < m:
+                curr[j1 + 1] = np.inf
+        prev, curr = curr, prev
+
+    return prev[m]
+
+
+# 在 import 時編譯（或從 numba 的磁碟快取載入），第一個請求不必承擔 JIT 時間
+_dtw_cost(np.zeros((2, 2), dtype=np.float32), -1)
+
+
+@njit(cache=True)
+def _dtw_cost_band(D_band, m, band):
+    """
+    同 _dtw_cost，但成本只以 band 條帶儲存
+
+    D_band[i - 1, j - i + band] 為第 i 列第 j 欄 (1-based) 的成本，形狀 [n, 2 * band + 1]；
+    _band_range 只會走訪 band 內的欄位，因此條帶索引一定在範圍內
+    """
+    n = D_band.shape[0]
+    prev = np.full(m + 1, np.inf, dtype=np.float32)
+    curr = np.full(m + 1, np.inf, dtype=np.float32)
+    prev[0] = 0.0
+
+    for i in range(1, n + 1):
+        j0, j1 = _band_range(i, m, band)
+        if j0 > j1:
+            curr[:] = np.inf  # 這一列沒有 band 內的格子
+        else:
+            curr[j0 - 1] = np.inf
+            for j in range(j0, j1 + 1):
+                best = prev[j] if prev[j] < curr[j - 1] else curr[j - 1]
+                best = best if best < prev[j - 1] else prev[j - 1]
+                curr[j] = D_band[i - 1, j - i + band] + best
+            if j1 < m:
+                curr[j1 + 1] = np.inf
+        prev, curr = curr, prev
+
+    return prev[m]
+
+
+_dtw_cost_band(np.zeros((2, 3), dtype=np.float32), 2, 1)
+
+
+def _dtw_distance(D: np.ndarray, band: Optional[int] = None) -> float:
     """
     計算 DTW 距離
 
     Args:
         D: 成本矩陣 [N, M]
+        band: Sakoe-Chiba band (None = 全局對齊)；band 外的格子不會被計算
 
     Returns:
         正規化的 DTW 距離
@@ -55,14 +164,188 @@ def _dtw_distance(D: np.ndarray) -> float:
         >>> print(f"DTW distance: {dist:.4f}")
     """
     n, m = D.shape
-    acc = np.full((n + 1, m + 1), np.inf, dtype=np.float32)
-    acc[0, 0] = 0.0
+    cost = _dtw_cost(np.ascontiguousarray(D, dtype=np.float32), -1 if band is None else band)
+    return float(cost / (n + m))
 
-    for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            acc[i, j] = D[i - 1, j - 1] + min(acc[i - 1, j], acc[i, j - 1], acc[i - 1, j - 1])
 
-    return float(acc[n, m] / (n + m))
+@njit(cache=True)
+def _diag_range(d, n, m, band):
+    """第 d 條反對角線 (i + j = d) 在 band 內的列範圍 [i0, i1]；band < 0 表示不限制"""
+    i0 = max(1, d - m)
+    i1 = min(n, d - 1)
+    if band >= 0:
+        # |i - j| = |2i - d| <= band
+        i0 = max(i0, (d - band + 1) // 2)
+        i1 = min(i1, (d + band) // 2)
+    return i0, i1
+
+
+# _fused_jsd_dtw 的型別簽名：四個 C-contiguous float32 矩陣 + band + eps
+_FUSED_JSD_DTW_SIGNATURE = (
+    "float32(float32[:, ::1], float32[:, ::1], float32[:, ::1], float32[:, ::1], int64, float64)"
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _fused_jsd_dtw_kernel(V: int):
+    """
+    取得詞彙大小為 V 的 _fused_jsd_dtw kernel（每個 V 只編譯一次）
+
+    V 以閉包常數的形式寫進 kernel，內層長度 V 的累加迴圈次數在編譯期已知，LLVM 可以展開並向量化；
+    明確的型別簽名讓 kernel 在建立時就編譯（或從 numba 的磁碟快取載入，快取 key 包含 V），
+    第一次比對不必承擔 JIT 時間
+
+    Args:
+        V: posteriorgram 的類別數（移除 blank 後）
+
+    Returns:
+        _fused_jsd_dtw(Pa, log_Pa, Pb, log_Pb, band, eps) -> DTW 累積成本
+    """
+
+    @njit(_FUSED_JSD_DTW_SIGNATURE, cache=True, parallel=True)
+    def _fused_jsd_dtw(Pa, log_Pa, Pb, log_Pb, band, eps):
+        """
+        JSD 成本與 DTW 合併在同一個迴圈：每格的 JSD 算完立即用於 DP，不建立 [na, nb] 成本矩陣
+
+        DP 沿反對角線 (i + j = d) 推進：同一條反對角線上的格子只依賴前兩條，
+        因此以 prange 平行計算每格的 JSD；只保留三條反對角線，以列索引 i 存放
+
+        每格只需要一次 log (log M)：log P 直接使用模型輸出的 log 機率；
+        band < 0 表示全局對齊，否則只計算 band 內的格子，band 外視為無法到達 (inf)
+
+        Args:
+            Pa, Pb: 機率分佈 [na, V]、[nb, V]
+            log_Pa, log_Pb: 對應的 log 機率（已歸一化的 log-posteriorgram）
+            band: DTW band constraint (< 0 = 全局對齊)
+            eps: log M 的數值穩定性參數
+
+        Returns:
+            DTW 累積成本（未正規化）
+        """
+        # DTW 與 band 都對稱，讓較短的序列當列，反對角線緩衝長度為 min(na, nb) + 1
+        if Pa.shape[0] > Pb.shape[0]:
+            Pa, log_Pa, Pb, log_Pb = Pb, log_Pb, Pa, log_Pa
+        n = Pa.shape[0]
+        m = Pb.shape[0]
+
+        diag_prev2 = np.full(n + 1, np.inf, dtype=np.float32)  # 反對角線 d-2
+        diag_prev1 = np.full(n + 1, np.inf, dtype=np.float32)  # 反對角線 d-1
+        diag_curr = np.full(n + 1, np.inf, dtype=np.float32)
+        diag_prev2[0] = 0.0  # d = 0: (0, 0)；d = 1 只有邊界格，全為 inf
+
+        if band >= 0 and m - n > band:
+            return np.inf  # (n, m) 在 band 外，無法到達
+
+        for d in range(2, n + m + 1):
+            i0, i1 = _diag_range(d, n, m, band)
+            # 之後兩條反對角線只會讀到 [i0 - 1, i1 + 1]；範圍兩端（含 i = 0 的邊界）設為 inf，
+            # 擋住三輪前殘留的值，不必每輪重設整條緩衝 (O(band) 而非 O(n))
+            diag_curr[i0 - 1] = np.inf
+            if i1 + 1 <= n:
+                diag_curr[i1 + 1] = np.inf
+            for i in prange(i0, i1 + 1):
+                j = d - i
+                kl_pm = 0.0
+                kl_qm = 0.0
+                for k in range(V):
+                    p = Pa[i - 1, k]
+                    q = Pb[j - 1, k]
+                    log_m = np.log(0.5 * (p + q) + eps)
+                    kl_pm += p * (log_Pa[i - 1, k] - log_m)
+                    kl_qm += q * (log_Pb[j - 1, k] - log_m)
+                cost = 0.5 * (kl_pm + kl_qm)
+
+                # min(上 (i-1, j), 左 (i, j-1), 左上 (i-1, j-1))
+                best = diag_prev1[i - 1] if diag_prev1[i - 1] < diag_prev1[i] else diag_prev1[i]
+                best = best if best < diag_prev2[i - 1] else diag_prev2[i - 1]
+                diag_curr[i] = cost + best
+            diag_prev2, diag_prev1, diag_curr = diag_prev1, diag_curr, diag_prev2
+
+        return diag_prev1[n]
+
+    return _fused_jsd_dtw
+
+
+# _jsd_matrix_torch 每個區塊的廣播暫存 [rows, nb, V] 不超過約 16M 個元素
+_JSD_BLOCK_ELEMENTS = 16 * 1024 * 1024
+
+
+@torch.inference_mode()
+def _jsd_matrix_torch(
+    log_pa: torch.Tensor,
+    log_pb: torch.Tensor,
+    eps: float = 1e-12,
+) -> torch.Tensor:
+    """
+    在 log_pa 所在的裝置上計算逐對 JSD 成本矩陣
+
+    log P 直接使用輸入的 log 機率，只有 log M 需要計算；
+    依列分塊廣播，限制 [rows, nb, V] 暫存的記憶體用量
+
+    Args:
+        log_pa: 已歸一化的 log 機率 [na, V]
+        log_pb: 已歸一化的 log 機率 [nb, V]
+        eps: log M 的數值穩定性參數
+
+    Returns:
+        JSD 距離矩陣 [na, nb] (float32，與輸入在同一裝置)
+    """
+    log_Pa, log_Pb = log_pa.float(), log_pb.float()
+    Pa, Pb = log_Pa.exp(), log_Pb.exp()
+
+    na, nb = Pa.size(0), Pb.size(0)
+    D = Pa.new_empty((na, nb))
+    block_rows = max(1, _JSD_BLOCK_ELEMENTS // max(1, nb * Pa.size(1)))
+    for i0 in range(0, na, block_rows):
+        i1 = min(na, i0 + block_rows)
+        log_m = (0.5 * (Pa[i0:i1, None, :] + Pb[None, :, :]) + eps).log()
+        kl_pm = (Pa[i0:i1, None, :] * (log_Pa[i0:i1, None, :] - log_m)).sum(-1)
+        kl_qm = (Pb[None, :, :] * (log_Pb[None, :, :] - log_m)).sum(-1)
+        D[i0:i1] = 0.5 * (kl_pm + kl_qm)
+    return D
+
+
+@torch.inference_mode()
+def _jsd_band_torch(
+    log_pa: torch.Tensor,
+    log_pb: torch.Tensor,
+    band: int,
+    eps: float = 1e-12,
+) -> torch.Tensor:
+    """
+    同 _jsd_matrix_torch，但只計算 Sakoe-Chiba band 內的格子
+
+    結果以條帶儲存：D_band[i, k] 為 (i, i - band + k) 的 JSD，超出 [0, nb) 的格子為 inf；
+    記憶體與運算量都從 O(na·nb) 降到 O(na·band)
+
+    Args:
+        log_pa: 已歸一化的 log 機率 [na, V]
+        log_pb: 已歸一化的 log 機率 [nb, V]
+        band: DTW band constraint (>= 0)
+        eps: log M 的數值穩定性參數
+
+    Returns:
+        JSD 條帶 [na, 2 * band + 1] (float32，與輸入在同一裝置)
+    """
+    log_Pa, log_Pb = log_pa.float(), log_pb.float()
+    Pa, Pb = log_Pa.exp(), log_Pb.exp()
+
+    na, nb = Pa.size(0), Pb.size(0)
+    width = 2 * band + 1
+    offsets = torch.arange(width, device=Pa.device) - band
+    D_band = Pa.new_empty((na, width))
+    block_rows = max(1, _JSD_BLOCK_ELEMENTS // max(1, width * Pa.size(1)))
+    for i0 in range(0, na, block_rows):
+        i1 = min(na, i0 + block_rows)
+        cols = torch.arange(i0, i1, device=Pa.device)[:, None] + offsets[None, :]  # [rows, width]
+        valid = (cols >= 0) & (cols < nb)
+        cols = cols.clamp(0, nb - 1)
+        pb, log_pb_rows = Pb[cols], log_Pb[cols]  # [rows, width, V]
+        log_m = (0.5 * (Pa[i0:i1, None, :] + pb) + eps).log()
+        kl_pm = (Pa[i0:i1, None, :] * (log_Pa[i0:i1, None, :] - log_m)).sum(-1)
+        kl_qm = (pb * (log_pb_rows - log_m)).sum(-1)
+        D_band[i0:i1] = (0.5 * (kl_pm + kl_qm)).masked_fill(~valid, float("inf"))
+    return D_band
 
 
 def _ppg_jsd_similarity(
@@ -72,6 +355,7 @@ def _ppg_jsd_similarity(
     metric: str = "jsd",
     band: Optional[int] = None,
     downsample: int = 3,
+    device: Optional[torch.device] = None,
 ) -> float:
     """
     計算兩個 posteriorgram 之間的相似度
@@ -83,9 +367,10 @@ def _ppg_jsd_similarity(
         metric: 距離度量 ("jsd" 或 "cosine")
         band: DTW band constraint (None = 全局對齊)
         downsample: 下採樣因子以加速計算
+        device: 計算 JSD 成本矩陣的裝置；CUDA 時在 GPU 上計算，其餘情況使用 CPU kernel
 
     Returns:
-        相似度分數 [0, 1]
+        相似度分數 [0, 1]；長度比例超過 PPG_MAX_LENGTH_RATIO 時為 0.0
 
     Example:
         >>> logp_a, _ = ctc.posteriors_and_spans(wav_a, sr_a)
@@ -96,33 +381,27 @@ def _ppg_jsd_similarity(
     # 移除 blank 類別並重新歸一化機率分佈
     # CTC 的 blank 幀很多，兩段都相似會系統性拉低 JSD、提高相似度
     # 因此移除 blank 維度，對剩餘維度重新歸一化
-    mask = torch.ones(logp_a.size(1), dtype=torch.bool)
-    mask[blank_id] = False
-
-    # 移除 blank 維度
-    logp_a_no_blank = logp_a[:, mask]  # [T_a, V-1]
-    logp_b_no_blank = logp_b[:, mask]  # [T_b, V-1]
-
-    # 重新歸一化 (log-sum-exp for numerical stability)
-    logp_a_normalized = logp_a_no_blank - torch.logsumexp(logp_a_no_blank, dim=1, keepdim=True)
-    logp_b_normalized = logp_b_no_blank - torch.logsumexp(logp_b_no_blank, dim=1, keepdim=True)
+    noblank_idx = _noblank_index(logp_a.size(1), blank_id).to(logp_a.device)
 
-    # 轉換為機率分佈
-    Pa = logp_a_normalized.exp().numpy()
-    Pb = logp_b_normalized.exp().numpy()
+    # 移除 blank 維度並以 log_softmax 重新歸一化（輸入已是 log 機率，等同減去 logsumexp）
+    logp_a_normalized = torch.log_softmax(logp_a.index_select(1, noblank_idx), dim=1)  # [T_a, V-1]
+    logp_b_normalized = torch.log_softmax(logp_b.index_select(1, noblank_idx), dim=1)  # [T_b, V-1]
 
     # 下採樣
     if downsample > 1:
-        Pa = Pa[::downsample]
-        Pb = Pb[::downsample]
+        logp_a_normalized = _downsample_logp(logp_a_normalized, downsample)
+        logp_b_normalized = _downsample_logp(logp_b_normalized, downsample)
 
-    na, nb = len(Pa), len(Pb)
-    D = np.zeros((na, nb), dtype=np.float32)
+    na, nb = logp_a_normalized.size(0), logp_b_normalized.size(0)
+
+    # 長度差異過大（超過 PPG_MAX_LENGTH_RATIO 倍）時不做 JSD + DTW，直接回傳 0
+    if min(na, nb) == 0 or max(na, nb) / min(na, nb) > PPG_MAX_LENGTH_RATIO:
+        return 0.0
 
     # 自動調整 band：如果長度差異大，需要更大的 band
     if band is not None:
         # 計算長度比例差異
-        length_ratio = max(na, nb) / min(na, nb) if min(na, nb) > 0 else 1.0
+        length_ratio = max(na, nb) / min(na, nb)
         # 如果長度差異 > 20%，自動增加 band
         if length_ratio > 1.2:
             suggested_band = int(abs(na - nb) * 1.5 + 50)
@@ -130,28 +409,35 @@ def _ppg_jsd_similarity(
                 band = suggested_band
                 print(f"Warning: 音檔長度差異較大 ({na} vs {nb} frames), 自動調整 band={band}")
 
-    # 計算 frame-wise 距離矩陣
-    if metric == "jsd":
-        for i in range(na):
-            if band is not None:
-                j0 = max(0, i - band)
-                j1 = min(nb, i + band + 1)
-                D[i, :] = 1e6  # 設定 band 外的為大值
-                for j in range(j0, j1):
-                    D[i, j] = _jsd_divergence(Pa[i], Pb[j])
-            else:
-                for j in range(nb):
-                    D[i, j] = _jsd_divergence(Pa[i], Pb[j])
+    # 計算 frame-wise 距離並以 DTW 對齊
+    if metric == "jsd" and device is not None and device.type == "cuda" and band is not None:
+        # GPU + band：只計算 band 條帶 [na, 2·band+1]，傳回 CPU 做 DTW
+        D_band = _jsd_band_torch(logp_a_normalized.to(device), logp_b_normalized.to(device), band)
+        cost = _dtw_cost_band(np.ascontiguousarray(D_band.cpu().numpy()), nb, band)
+        dist = float(cost / (na + nb))
+    elif metric == "jsd" and device is not None and device.type == "cuda":
+        # GPU：JSD 成本矩陣在裝置上計算，只有 [na, nb] 的 D 傳回 CPU 做 DTW
+        D = _jsd_matrix_torch(logp_a_normalized.to(device), logp_b_normalized.to(device))
+        dist = _dtw_distance(D.cpu().numpy())
+    elif metric == "jsd":
+        # CPU：JSD 在 DTW 迴圈內逐格計算，不建立成本矩陣
+        # log 機率已經有了，只需要 exp 一次取得機率
+        log_Pa = np.ascontiguousarray(logp_a_normalized.numpy(), dtype=np.float32)
+        log_Pb = np.ascontiguousarray(logp_b_normalized.numpy(), dtype=np.float32)
+        cost = _fused_jsd_dtw_kernel(log_Pa.shape[1])(
+            np.exp(log_Pa), log_Pa, np.exp(log_Pb), log_Pb, -1 if band is None else band, 1e-12
+        )
+        dist = float(cost / (na + nb))
     else:  # cosine
-        for i in range(na):
-            for j in range(nb):
-                cos_sim = (Pa[i] * Pb[j]).sum() / (
-                    np.linalg.norm(Pa[i]) * np.linalg.norm(Pb[j]) + 1e-9
-                )
-                D[i, j] = 1.0 - cos_sim
+        Pa = logp_a_normalized.exp().numpy()
+        Pb = logp_b_normalized.exp().numpy()
+        # 每一幀先做 L2 正規化，所有幀對的 cosine 相似度就是一次矩陣乘法
+        Pa_n = Pa / (np.linalg.norm(Pa, axis=1, keepdims=True) + 1e-9)
+        Pb_n = Pb / (np.linalg.norm(Pb, axis=1, keepdims=True) + 1e-9)
+        D = (1.0 - Pa_n @ Pb_n.T).astype(np.float32)
 
-    # 使用 DTW 計算對齊距離
-    dist = _dtw_distance(D)
+        # 使用 DTW 計算對齊距離（band 在 DTW 內處理）
+        dist = _dtw_distance(D, band=band)
 
     # 轉換為相似度，加入 clamp 避免數值問題
     similarity = np.exp(-dist)
@@ -175,7 +461,7 @@ def calculate_ppg_similarity(
     Args:
         audio_a_path: 音檔 A 路徑
         audio_b_path: 音檔 B 路徑
-        ctc: PhoneCTC 實例 (可選，重用以節省載入時間)
+        ctc: PhoneCTC 實例 (可選，預設使用共用的 get_default_ctc())
         metric: 距離度量 ("jsd" 或 "cosine")
             - "jsd": Jensen-Shannon Divergence (預設，更適合機率分佈)
             - "cosine": Cosine distance (計算較快)
@@ -221,15 +507,13 @@ def calculate_ppg_similarity(
     """
     # 初始化 CTC 模型
     if ctc is None:
-        ctc = PhoneCTC()
-
-    # 載入音檔
-    wav_a, sr_a = torchaudio.load(str(audio_a_path))
-    wav_b, sr_b = torchaudio.load(str(audio_b_path))
+        ctc = get_default_ctc()
 
     # 獲取音素 posteriorgrams
-    logp_a, _ = ctc.posteriors_and_spans(wav_a, sr_a)
-    logp_b, _ = ctc.posteriors_and_spans(wav_b, sr_b)
+    # 依音檔內容快取，參考音檔不必重複推論；兩段都沒有快取時合併成一次 forward
+    (logp_a, _), (logp_b, _) = ctc.cached_posteriors_and_spans_batch(
+        [audio_a_path, audio_b_path]
+    )
 
     # 空序列/全靜音保護
     if logp_a.size(0) < 5 or logp_b.size(0) < 5:
@@ -237,7 +521,13 @@ def calculate_ppg_similarity(
 
     # 計算 PPG JSD 相似度 (傳入 blank_id 以移除 blank 類別)
     similarity = _ppg_jsd_similarity(
-        logp_a, logp_b, blank_id=ctc.blank, metric=metric, band=band, downsample=downsample
+        logp_a,
+        logp_b,
+        blank_id=ctc.blank,
+        metric=metric,
+        band=band,
+        downsample=downsample,
+        device=ctc.device,
     )
 
     # Clamp 到 [0, 1] 避免數值問題
@@ -18,8 +18,13 @@ import torch
 import torch.nn as nn
 import numpy as np
 import pickle
+import threading
 from pathlib import Path
 
+# get_predictor() 共用的預設實例：模型與標準化器只載入一次
+_PREDICTOR_SINGLETON = None
+_PREDICTOR_LOCK = threading.Lock()
+
 
 class TinyModel(nn.Module):
     """極簡模型架構 (3→32→1)"""
@@ -71,10 +76,31 @@ class RatingPredictor:
         self.model = self.model.to(self.device)
         self.model.eval()
 
+        # 匯出權重為 NumPy：161 個參數的 3→32→1 網路，直接用 NumPy 計算比經過 PyTorch dispatcher 快得多
+        # (eval 模式下 dropout 不作用)
+        self.W1 = self.model.fc1.weight.detach().cpu().numpy()
+        self.b1 = self.model.fc1.bias.detach().cpu().numpy()
+        self.W2 = self.model.fc2.weight.detach().cpu().numpy()
+        self.b2 = self.model.fc2.bias.detach().cpu().numpy()
+
         # 載入標準化器
         with open(scaler_path, 'rb') as f:
             self.scaler = pickle.load(f)
 
+        # 標準化 (x - mean) / scale 與 fc1 都是仿射變換，預先合併成一組權重：
+        # W1' = W1 / scale，b1' = b1 - W1 @ (mean / scale)
+        n_features = self.W1.shape[1]
+        mean = self.scaler.mean_ if self.scaler.with_mean else np.zeros(n_features)
+        scale = self.scaler.scale_ if self.scaler.with_std else np.ones(n_features)
+        self.W1_fused = self.W1 / scale
+        self.b1_fused = self.b1 - self.W1 @ (mean / scale)
+
+        # 實例可能被多個 request 共用，權重與標準化參數設為唯讀以防意外修改
+        for arr in (self.W1, self.b1, self.W2, self.b2, self.W1_fused, self.b1_fused,
+                    self.scaler.mean_, self.scaler.scale_):
+            if isinstance(arr, np.ndarray):
+                arr.setflags(write=False)
+
         print(f"✅ 模型已載入")
         print(f"   - 設備: {self.device}")
         print(f"   - 特徵: PER, PPG, Energy")
@@ -108,17 +134,10 @@ class RatingPredictor:
             features = [features[key] for key in feature_order]
 
         # 轉換為 numpy array
-        features = np.array(features).reshape(1, -1)
-
-        # 標準化
-        features_scaled = self.scaler.transform(features)
+        features = np.array(features, dtype=np.float64).reshape(1, -1)
 
-        # 轉換為 tensor
-        features_tensor = torch.FloatTensor(features_scaled).to(self.device)
-
-        # 預測
-        with torch.no_grad():
-            prediction = self.model(features_tensor).cpu().item()
+        # 預測（標準化已併入 fc1 權重）
+        prediction = self._forward(features).item()
 
         # 限制在 1-5 範圍內
         prediction = max(1.0, min(5.0, prediction))
@@ -145,12 +164,33 @@ class RatingPredictor:
             >>> print(ratings)
             [4.85, 3.22]
         """
-        predictions = []
-        for features in features_list:
-            prediction = self.predict(features)
-            predictions.append(prediction)
+        if len(features_list) == 0:
+            return []
+
+        # 轉換為 (N, 3) numpy array
+        feature_order = ['score_PER', 'score_PPG', 'score_Energy']
+        features = np.array([
+            [f[key] for key in feature_order] if isinstance(f, dict) else f
+            for f in features_list
+        ], dtype=np.float64).reshape(len(features_list), -1)
+
+        # 單次前向傳播（標準化已併入 fc1 權重），限制在 1-5 範圍內
+        predictions = np.clip(self._forward(features), 1.0, 5.0)
+
+        return predictions.tolist()
+
+    def _forward(self, features):
+        """
+        以 NumPy 計算標準化 + TinyModel 前向傳播
+
+        Args:
+            features: 原始特徵 (N, 3)，標準化由合併後的 fc1 權重完成
 
-        return predictions
+        Returns:
+            np.ndarray: 預測值 (N,)
+        """
+        h = np.maximum(0.0, features @ self.W1_fused.T + self.b1_fused)
+        return (h @ self.W2.T + self.b2).reshape(-1)
 
     def get_model_info(self):
         """
@@ -171,6 +211,22 @@ class RatingPredictor:
         }
 
 
+def get_predictor():
+    """
+    取得共用的預設 RatingPredictor（第一次呼叫時載入模型與標準化器）
+
+    Returns:
+        RatingPredictor: 預設路徑的預測器實例
+    """
+    global _PREDICTOR_SINGLETON
+    if _PREDICTOR_SINGLETON is None:
+        with _PREDICTOR_LOCK:
+            # 在鎖內再檢查一次，避免多個 request thread 同時載入
+            if _PREDICTOR_SINGLETON is None:
+                _PREDICTOR_SINGLETON = RatingPredictor()
+    return _PREDICTOR_SINGLETON
+
+
 # ============ 使用範例 ============
 
 if __name__ == '__main__':
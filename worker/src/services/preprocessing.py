@@ -4,13 +4,13 @@
 """
 
 import subprocess
-import tempfile
 from pathlib import Path
 from typing import Union
 
 import librosa
 import numpy as np
 import soundfile as sf
+import soxr
 
 # Optional dependencies
 try:
@@ -25,6 +25,28 @@ def _run_command(cmd: list[str]) -> None:
     subprocess.run(cmd, check=True)
 
 
+def _load_mono(path: Union[str, Path], target_sr: int) -> tuple[np.ndarray, int]:
+    """
+    讀取音檔為單聲道 float32 並重採樣到 target_sr
+
+    libsndfile 能讀的格式（wav, flac, ogg, mp3）直接解碼並以 soxr 重採樣；
+    webm / m4a 等 libsndfile 不支援的格式才交給 librosa (audioread / ffmpeg)
+    """
+    try:
+        y, sr = sf.read(str(path), dtype="float32", always_2d=True)
+    except sf.LibsndfileError:
+        return librosa.load(str(path), sr=target_sr, mono=True)
+
+    return _resample(y.mean(axis=1), sr, target_sr), target_sr
+
+
+def _resample(y: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    """在記憶體中以 soxr (SIMD FIR) 重採樣單聲道波形"""
+    if orig_sr == target_sr:
+        return y
+    return soxr.resample(y, orig_sr, target_sr, quality="HQ").astype(np.float32, copy=False)
+
+
 def preprocess_pipeline(
     src_path: Union[str, Path],
     out_path: Union[str, Path],
@@ -66,86 +88,63 @@ def preprocess_pipeline(
         >>> cleaned = preprocess_pipeline("raw.wav", "clean.wav", use_deepfilter=False)
 
     Note:
-        librosa.load() 會自動處理格式轉換，支援的格式取決於安裝的音訊後端
-        (soundfile, audioread, ffmpeg 等)。常見格式如 wav, mp3, webm, ogg 都支援。
+        libsndfile 支援的格式 (wav, flac, ogg, mp3) 以 soundfile 讀取；其他格式 (webm 等)
+        由 librosa.load() 處理，支援的格式取決於安裝的音訊後端 (audioread, ffmpeg 等)。
     """
     src_path = str(src_path)
     out_path = str(out_path)
 
-    with tempfile.TemporaryDirectory() as td:
-        step1 = f"{td}/step1.wav"
-        step1_48k = f"{td}/step1_48k.wav" if use_deepfilter else None
-        step2 = f"{td}/step2.wav" if use_deepfilter else step1
-        step3 = out_path
-
-        # Step 1: 峰值正規化到 -3 dBFS + 轉單聲道/16kHz
-        # 使用 librosa 確保準確的峰值控制
-        y, sr = librosa.load(src_path, sr=target_sr, mono=True)
-        peak = float(np.max(np.abs(y)) + 1e-9)
-        target_amp = 10 ** (target_peak_dbfs / 20)  # -3 dBFS -> ~0.707
-        gain = min(target_amp / peak, 10.0)  # 限制最大增益避免極端放大
-        y = y * gain
-        sf.write(step1, y, target_sr)
-
-        # Step 2: DeepFilterNet 降噪 (可選)
-        if use_deepfilter:
-            try:
-                # DeepFilterNet 需要 48kHz 音訊
-                # Step 2a: 轉換為 48kHz
-                y_48k, _ = librosa.load(step1, sr=48000, mono=True)
-                sf.write(step1_48k, y_48k, 48000)
-
-                # Step 2b: 使用 Python API 進行降噪
-                import torch as torch_df
-                from df import enhance, init_df
-
-                model, df_state, _ = init_df()
-                # 轉換為 torch.Tensor 並增加 batch 維度
-                audio_tensor = torch_df.from_numpy(y_48k).float().unsqueeze(0)
-                audio_enhanced = enhance(model, df_state, audio_tensor)
-                # 移除 batch 維度並轉回 numpy
-                if isinstance(audio_enhanced, torch_df.Tensor):
-                    audio_enhanced = audio_enhanced.squeeze(0).cpu().numpy()
-
-                # Step 2c: 轉回目標採樣率
-                # 先寫入 48kHz 檔案
-                temp_enhanced_48k = f"{td}/enhanced_48k.wav"
-                sf.write(temp_enhanced_48k, audio_enhanced, 48000)
-                # 再轉回 target_sr
-                y_enhanced, _ = librosa.load(temp_enhanced_48k, sr=target_sr, mono=True)
-                sf.write(step2, y_enhanced, target_sr)
-            except (ImportError, Exception) as e:
-                print(f"Warning: DeepFilterNet not available ({e}), skipping noise reduction")
-                step2 = step1
-
-        # Step 3: LUFS 正規化
-        if HAS_PYLOUDNORM:
-            # 使用 pyloudnorm (更簡單直接)
-            y, sr = librosa.load(step2, sr=target_sr, mono=True)
-            meter = pyln.Meter(sr)
-            loudness = meter.integrated_loudness(y)
-            gain = target_lufs - loudness
-            y_norm = y * (10 ** (gain / 20))
-
-            # 防止 clipping
-            mx = np.max(np.abs(y_norm))
-            if mx > 0.999:
-                y_norm = y_norm / mx * 0.999
-
-            sf.write(step3, y_norm, sr)
-        else:
-            # Fallback: 簡單增益調整
-            y, sr = librosa.load(step2, sr=target_sr, mono=True)
-            # 估算當前響度並調整
-            rms = np.sqrt(np.mean(y ** 2))
-            target_rms = 10 ** (target_lufs / 20) * 0.1  # 粗略轉換
-            if rms > 1e-6:
-                y_norm = y * (target_rms / rms)
-                mx = np.max(np.abs(y_norm))
-                if mx > 0.999:
-                    y_norm = y_norm / mx * 0.999
-                sf.write(step3, y_norm, sr)
-            else:
-                sf.write(step3, y, sr)
-
+    # Step 1: 峰值正規化到 -3 dBFS + 轉單聲道/16kHz
+    # 在 float32 波形上計算峰值，確保準確的峰值控制；之後整條流程都留在記憶體中，只在最後寫檔一次
+    y, _ = _load_mono(src_path, target_sr)
+    peak = float(np.max(np.abs(y)))
+    target_amp = 10 ** (target_peak_dbfs / 20)  # -3 dBFS -> ~0.707
+    gain = min(target_amp / (peak + 1e-9), 10.0)  # 限制最大增益避免極端放大
+    y = (y * gain).astype(np.float32, copy=False)
+    peak *= gain  # 縮放後的峰值，不必再掃一次波形
+
+    # Step 2: DeepFilterNet 降噪 (可選)
+    if use_deepfilter:
+        try:
+            # DeepFilterNet 需要 48kHz 音訊
+            # Step 2a: 在記憶體中轉換為 48kHz
+            y_48k = _resample(y, target_sr, 48000)
+
+            # Step 2b: 使用 Python API 進行降噪
+            import torch as torch_df
+            from df import enhance, init_df
+
+            model, df_state, _ = init_df()
+            # 轉換為 torch.Tensor 並增加 batch 維度
+            audio_tensor = torch_df.from_numpy(y_48k).float().unsqueeze(0)
+            audio_enhanced = enhance(model, df_state, audio_tensor)
+            # 移除 batch 維度並轉回 numpy
+            if isinstance(audio_enhanced, torch_df.Tensor):
+                audio_enhanced = audio_enhanced.squeeze(0).cpu().numpy()
+
+            # Step 2c: 轉回目標採樣率
+            y = _resample(np.asarray(audio_enhanced, dtype=np.float32).reshape(-1), 48000, target_sr)
+            peak = float(np.max(np.abs(y)))
+        except (ImportError, Exception) as e:
+            print(f"Warning: DeepFilterNet not available ({e}), skipping noise reduction")
+
+    # Step 3: LUFS 正規化
+    if HAS_PYLOUDNORM:
+        # 使用 pyloudnorm (更簡單直接)
+        meter = pyln.Meter(target_sr)
+        loudness = meter.integrated_loudness(y)
+        gain_linear = 10 ** ((target_lufs - loudness) / 20)
+    else:
+        # Fallback: 簡單增益調整
+        # 估算當前響度並調整
+        rms = np.sqrt(np.mean(y ** 2))
+        target_rms = 10 ** (target_lufs / 20) * 0.1  # 粗略轉換
+        gain_linear = target_rms / rms if rms > 1e-6 else 1.0
+
+    # 防止 clipping：增益後的峰值 = 原峰值 × 增益，直接在套用前限制增益
+    if peak * gain_linear > 0.999:
+        gain_linear = 0.999 / peak
+    y *= gain_linear
+
+    sf.write(out_path, y, target_sr)
     return Path(out_path)
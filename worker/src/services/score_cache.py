@@ -0,0 +1,188 @@
+"""
+AI 評分快取 (Redis)
+放在 Supabase 前面的快取層，減少每次請求對資料庫的網路往返
+
+- 單一評分:   ai_score:{user_id}:{course_id}:{sentence_id}:{slot_index}
+- 整門課評分: ai_scores_course:{user_id}:{course_id}
+- 音檔內容評分: score:v1:{ref_hash}:{test_hash}（相同音檔內容直接回傳，不分使用者）
+
+未安裝 redis 套件或未設定 REDIS_URL 時自動停用，所有函式變成 no-op；
+Redis 發生錯誤或連不上時只會記錄警告（連線與讀寫都有短逾時），不影響評分流程
+"""
+
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import orjson
+
+# Optional dependencies
+try:
+    import redis
+
+    HAS_REDIS = True
+except ImportError:
+    redis = None
+    HAS_REDIS = False
+
+logger = logging.getLogger(__name__)
+
+
+# 整門課的評分快取時間（秒），另外在評分寫入/刪除時主動失效
+COURSE_SCORES_TTL = 300
+# 單一評分的快取時間（秒）
+SLOT_SCORE_TTL = 24 * 60 * 60
+# 音檔內容評分的快取時間（秒）
+CONTENT_SCORE_TTL = 24 * 60 * 60
+# 評分模型改變時遞增，讓舊的內容快取失效
+CONTENT_SCORE_VERSION = 1
+
+# Redis 連線與讀寫的逾時（秒）：Redis 無回應時快速放棄，不拖慢評分請求
+REDIS_SOCKET_TIMEOUT = 0.25
+# 閒置連線超過此秒數後，使用前先 PING 確認連線仍有效
+REDIS_HEALTH_CHECK_INTERVAL = 30
+
+# 全域 connection pool，所有請求共用 TCP 連線
+_pool: Optional["redis.ConnectionPool"] = None
+
+
+def get_redis() -> Optional["redis.Redis"]:
+    """
+    取得 Redis 客戶端
+
+    Returns:
+        redis.Redis 實例，如果快取未啟用則回傳 None
+    """
+    global _pool
+    if not HAS_REDIS:
+        return None
+
+    url = os.getenv('REDIS_URL')
+    if not url:
+        return None
+
+    if _pool is None:
+        _pool = redis.ConnectionPool.from_url(
+            url,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        )
+    return redis.Redis(connection_pool=_pool)
+
+
+def _slot_key(user_id: str, course_id: str, sentence_id: int, slot_index: int) -> str:
+    return f"ai_score:{user_id}:{course_id}:{sentence_id}:{slot_index}"
+
+
+def _course_key(user_id: str, course_id: str) -> str:
+    return f"ai_scores_course:{user_id}:{course_id}"
+
+
+def _content_key(ref_hash: str, test_hash: str) -> str:
+    return f"score:v{CONTENT_SCORE_VERSION}:{ref_hash}:{test_hash}"
+
+
+def get_slot_score(
+    user_id: str,
+    course_id: str,
+    sentence_id: int,
+    slot_index: int
+) -> Optional[float]:
+    """讀取單一評分，沒有快取時回傳 None"""
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        raw = r.get(_slot_key(user_id, course_id, sentence_id, slot_index))
+        return float(raw) if raw is not None else None
+    except Exception as e:
+        logger.warning("Redis get failed: %s", e)
+        return None
+
+
+def set_slot_score(
+    user_id: str,
+    course_id: str,
+    sentence_id: int,
+    slot_index: int,
+    score: float
+) -> None:
+    """寫入單一評分，並讓整門課的快取失效"""
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        pipe = r.pipeline()
+        pipe.setex(_slot_key(user_id, course_id, sentence_id, slot_index), SLOT_SCORE_TTL, score)
+        pipe.delete(_course_key(user_id, course_id))
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Redis set failed: %s", e)
+
+
+def delete_slot_score(
+    user_id: str,
+    course_id: str,
+    sentence_id: int,
+    slot_index: int
+) -> None:
+    """刪除單一評分快取，並讓整門課的快取失效"""
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.delete(
+            _slot_key(user_id, course_id, sentence_id, slot_index),
+            _course_key(user_id, course_id)
+        )
+    except Exception as e:
+        logger.warning("Redis delete failed: %s", e)
+
+
+def get_course_scores(user_id: str, course_id: str) -> Optional[Dict[str, Any]]:
+    """讀取整門課的評分 {sentence_id: {slot_index: score}}，沒有快取時回傳 None"""
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        raw = r.get(_course_key(user_id, course_id))
+        return orjson.loads(raw) if raw is not None else None
+    except Exception as e:
+        logger.warning("Redis get failed: %s", e)
+        return None
+
+
+def set_course_scores(user_id: str, course_id: str, scores: Dict[str, Any]) -> None:
+    """寫入整門課的評分"""
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.setex(_course_key(user_id, course_id), COURSE_SCORES_TTL, orjson.dumps(scores))
+    except Exception as e:
+        logger.warning("Redis set failed: %s", e)
+
+
+def get_content_score(ref_hash: str, test_hash: str) -> Optional[float]:
+    """依兩個音檔的內容雜湊讀取評分，沒有快取時回傳 None"""
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        raw = r.get(_content_key(ref_hash, test_hash))
+        return float(raw) if raw is not None else None
+    except Exception as e:
+        logger.warning("Redis get failed: %s", e)
+        return None
+
+
+def set_content_score(ref_hash: str, test_hash: str, score: float) -> None:
+    """依兩個音檔的內容雜湊寫入評分"""
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.setex(_content_key(ref_hash, test_hash), CONTENT_SCORE_TTL, score)
+    except Exception as e:
+        logger.warning("Redis set failed: %s", e)
@@ -1,22 +1,105 @@
+import functools
+import os
+from pathlib import Path
+
 import numpy as np
 import parselmouth
-from scipy.spatial.distance import euclidean
-from typing import Tuple, List
+from numba import njit
+from typing import Tuple, List, Optional, Union
 import warnings
 warnings.filterwarnings('ignore')
 
 
+@njit(cache=True)
+def _dtw_fill(s1, s2, band):
+    """
+    DTW 前向計算 (Sakoe-Chiba band)，回傳累積成本矩陣與每格的前驅方向
+
+    step: 0 = 匹配 (i-1, j-1)、1 = 插入 (i-1, j)、2 = 刪除 (i, j-1)；
+    平手時的優先順序與回溯一致（匹配 → 插入 → 刪除）
+    不使用 fastmath：band 外的格子以 inf 表示，fastmath 會假設沒有 inf
+    """
+    n, m = s1.shape[0], s2.shape[0]
+    dtw = np.full((n + 1, m + 1), np.inf)
+    step = np.zeros((n + 1, m + 1), dtype=np.int8)
+    dtw[0, 0] = 0.0
+
+    for i in range(1, n + 1):
+        for j in range(max(1, i - band), min(m, i + band) + 1):
+            # 歐氏距離
+            d = 0.0
+            for k in range(s1.shape[1]):
+                t = s1[i - 1, k] - s2[j - 1, k]
+                d += t * t
+            d = np.sqrt(d)
+
+            best = dtw[i - 1, j - 1]
+            direction = 0
+            if dtw[i - 1, j] < best:
+                best = dtw[i - 1, j]
+                direction = 1
+            if dtw[i, j - 1] < best:
+                best = dtw[i, j - 1]
+                direction = 2
+            dtw[i, j] = d + best
+            step[i, j] = direction
+
+    return dtw, step
+
+
+# 在 import 時編譯（或從 numba 的磁碟快取載入），第一個請求不必承擔 JIT 時間
+_dtw_fill(np.zeros((1, 1)), np.zeros((1, 1)), 1)
+
+
+def _praat_cubic_interp(values: np.ndarray, x1: float, dx: float, t: np.ndarray) -> np.ndarray:
+    """
+    一次在多個時間點取值，結果與 Praat 的 get_value(t)（cubic 內插）相同
+
+    內插公式取自 Praat 的 NUM_interpolate_sinc（maxDepth = 2）：
+    最靠近邊界的兩個區間退化為線性內插，範圍外夾到端點值，超出取樣範圍 (x1 ± dx/2) 的時間點為 nan
+    """
+    y = np.asarray(values, dtype=float)
+    nx = y.size
+    x = np.clip((t - x1) / dx, 0, nx - 1)  # 0-based 的分數索引
+
+    left = np.minimum(np.floor(x).astype(np.int64), max(nx - 2, 0))
+    right = np.minimum(left + 1, nx - 1)
+    yl, yr = y[left], y[right]
+    fil = x - left
+    fir = 1.0 - fil
+    result = yl * fir + yr * fil
+
+    # 兩側都有鄰點的區間才使用 cubic 修正項
+    cubic = (left >= 1) & (left <= nx - 3)
+    dyl = 0.5 * (yr - y[np.maximum(left - 1, 0)])
+    dyr = 0.5 * (y[np.minimum(right + 1, nx - 1)] - yl)
+    correction = fil * fir * (0.5 * (dyr - dyl) + (fil - 0.5) * (dyl + dyr - 2 * (yr - yl)))
+    result = np.where(cubic, result - correction, result)
+
+    left_edge = x1 - 0.5 * dx
+    outside = (t < left_edge) | (t > left_edge + nx * dx)
+    return np.where(outside, np.nan, result)
+
+# 已對齊特徵的記憶體快取大小（以音檔組合計）
+ALIGNMENT_CACHE_SIZE = 32
+
+
 class SpeechMetrics:
     """語音評估指標計算器 - 只返回分數"""
     
     def __init__(self, frame_shift=0.010):
         self.frame_shift = frame_shift
         self.gpe_threshold = 20  # Hz
+
+        # 以兩個音檔的 (路徑, 大小, mtime) 為 key 的記憶體 LRU，每個實例各自一份
+        self._cached_alignment = functools.lru_cache(maxsize=ALIGNMENT_CACHE_SIZE)(
+            self._align_files
+        )
     
     # ==================== 特徵提取 ====================
-    def extract_features(self, audio_path: str) -> dict:
-        """提取語音特徵"""
-        sound = parselmouth.Sound(audio_path)
+    def extract_features(self, audio: Union[str, parselmouth.Sound]) -> dict:
+        """提取語音特徵（audio 可為音檔路徑或已載入的 parselmouth.Sound）"""
+        sound = audio if isinstance(audio, parselmouth.Sound) else parselmouth.Sound(str(audio))
         
         # F0
         pitch = sound.to_pitch(
@@ -24,21 +107,15 @@ class SpeechMetrics:
             pitch_floor=75.0,
             pitch_ceiling=600.0
         )
-        f0_values, time_points = [], []
-        for i in range(pitch.n_frames):
-            t = pitch.get_time_from_frame_number(i + 1)
-            f0 = pitch.get_value_at_time(t)
-            f0_values.append(f0 if f0 is not None and not np.isnan(f0) else 0.0)
-            time_points.append(t)
-        f0_values = np.nan_to_num(np.array(f0_values, dtype=float))
+        # 一次取出整條 F0 軌跡（無聲幀為 0），不逐幀呼叫 Praat
+        f0_values = np.nan_to_num(pitch.selected_array['frequency'].astype(float))
+        time_points = pitch.xs()
         
-        # Intensity
+        # Intensity：以 Praat 的 cubic 內插一次取到 F0 的時間軸，超出範圍的幀為 0
         intensity = sound.to_intensity(time_step=self.frame_shift, minimum_pitch=75.0)
-        intensity_values = []
-        for t in time_points:
-            v = intensity.get_value(t)
-            intensity_values.append(v if v is not None else 0.0)
-        intensity_values = np.nan_to_num(np.array(intensity_values, dtype=float))
+        intensity_values = np.nan_to_num(_praat_cubic_interp(
+            intensity.values[0], intensity.x1, intensity.dx, time_points
+        ))
         
         # Voiced
         voiced = (f0_values > 0.0) & (intensity_values > 30.0)
@@ -65,21 +142,12 @@ class SpeechMetrics:
         # Sakoe-Chiba band constraint
         band = max(abs(n - m), max(n, m) // 10)
 
-        dtw = np.full((n + 1, m + 1), np.inf, dtype=float)
-        dtw[0, 0] = 0.0
-
-        # 前向計算
-        for i in range(1, n + 1):
-            j_start = max(1, i - band)
-            j_end = min(m, i + band)
-
-            for j in range(j_start, j_end + 1):
-                cost = euclidean(seq1[i - 1], seq2[j - 1])
-                dtw[i, j] = cost + min(
-                    dtw[i - 1, j],      # 插入
-                    dtw[i, j - 1],      # 刪除
-                    dtw[i - 1, j - 1]   # 匹配
-                )
+        # 前向計算 (numba kernel)
+        _, steps = _dtw_fill(
+            np.ascontiguousarray(seq1, dtype=np.float64),
+            np.ascontiguousarray(seq2, dtype=np.float64),
+            band,
+        )
 
         # 正確的回溯：從 (n, m) 開始
         path = []
@@ -88,9 +156,8 @@ class SpeechMetrics:
         while i > 0 and j > 0:
             path.append((i - 1, j - 1))  # 對齊到原序列索引（0-based）
 
-            # 選擇最小代價的前驅
-            candidates = [dtw[i - 1, j - 1], dtw[i - 1, j], dtw[i, j - 1]]
-            step = np.argmin(candidates)
+            # 最小代價的前驅已在前向計算時記錄
+            step = steps[i, j]
 
             if step == 0:      # 匹配
                 i -= 1
@@ -147,6 +214,73 @@ class SpeechMetrics:
         
         return aligned_feat1, aligned_feat2
     
+    # ==================== 特徵對齊快取 ====================
+    @staticmethod
+    def _file_key(path: Union[str, Path]) -> Optional[Tuple[str, int, int]]:
+        """
+        快取 key：(絕對路徑, 檔案大小, mtime_ns)；不可快取時回傳 None
+
+        /proc/<pid>/fd/<n> 形式的上傳檔 (O_TMPFILE) 不快取：fd 編號會被之後的上傳重複使用，
+        路徑、大小與 mtime 都可能相同，當作 key 會把上一個上傳檔的特徵回傳給下一個
+        """
+        path = str(path)
+        if path.startswith("/proc/"):
+            return None
+        path = str(Path(path).resolve())
+        stat = os.stat(path)
+        return path, stat.st_size, stat.st_mtime_ns
+
+    def _align_files(self, key_ref: Tuple[str, int, int],
+                     key_test: Tuple[str, int, int]) -> Tuple[dict, dict]:
+        """依檔案 key 提取並對齊特徵（由 _cached_alignment 包成 LRU）"""
+        feat1 = self.extract_features(key_ref[0])
+        feat2 = self.extract_features(key_test[0])
+        aligned_feat1, aligned_feat2 = self.align_features(feat1, feat2)
+
+        # 快取的結果會被多次呼叫共用，設為唯讀以防意外原地修改
+        for aligned in (aligned_feat1, aligned_feat2):
+            for arr in aligned.values():
+                arr.setflags(write=False)
+        return aligned_feat1, aligned_feat2
+
+    def aligned_features(self, audio_ref: Union[str, Path, parselmouth.Sound],
+                         audio_test: Union[str, Path, parselmouth.Sound]) -> Tuple[dict, dict]:
+        """
+        提取並以 DTW 對齊兩段音訊的特徵
+
+        兩者皆為一般檔案路徑時（/proc/ 下的上傳檔除外），結果依 (路徑, 大小, mtime) 快取，
+        同一組音檔計算多個指標只需提取、對齊一次；快取的陣列會與其他呼叫共用，因此為唯讀
+        """
+        if not isinstance(audio_ref, parselmouth.Sound) and not isinstance(audio_test, parselmouth.Sound):
+            key_ref, key_test = self._file_key(audio_ref), self._file_key(audio_test)
+            if key_ref is not None and key_test is not None:
+                return self._cached_alignment(key_ref, key_test)
+        feat1 = self.extract_features(audio_ref)
+        feat2 = self.extract_features(audio_test)
+        return self.align_features(feat1, feat2)
+
+    def compute_all(self, audio_ref: Union[str, Path, parselmouth.Sound],
+                    audio_test: Union[str, Path, parselmouth.Sound],
+                    threshold_semitone: float = 3.0) -> dict:
+        """
+        一次計算所有指標（特徵只提取、對齊一次）
+
+        Args:
+            threshold_semitone: GPE_log / GPE_offset 的半音閾值，預設3半音
+
+        Returns:
+            dict: {'VDE', 'GPE', 'GPE_log', 'GPE_offset', 'Energy', 'FFE'} 各指標的相似度分數 (0-1)
+        """
+        aligned_feat1, aligned_feat2 = self.aligned_features(audio_ref, audio_test)
+        return {
+            'VDE': self._vde_score(aligned_feat1, aligned_feat2),
+            'GPE': self._gpe_score(aligned_feat1, aligned_feat2),
+            'GPE_log': self._gpe_log_score(aligned_feat1, aligned_feat2, threshold_semitone),
+            'GPE_offset': self._gpe_offset_score(aligned_feat1, aligned_feat2, threshold_semitone),
+            'Energy': self._energy_score(aligned_feat1, aligned_feat2),
+            'FFE': self._ffe_score(aligned_feat1, aligned_feat2),
+        }
+
     # ==================== 評估指標函數 ====================
 
     def calculate_vde(self, audio_ref: str, audio_test: str) -> float:
@@ -158,16 +292,8 @@ class SpeechMetrics:
                    1.0 = 濁音判斷完全一致
                    0.0 = 濁音判斷完全不同
         """
-        feat1 = self.extract_features(audio_ref)
-        feat2 = self.extract_features(audio_test)
-        aligned_feat1, aligned_feat2 = self.align_features(feat1, feat2)
+        return self._vde_score(*self.aligned_features(audio_ref, audio_test))
 
-        vde_frames = np.logical_xor(aligned_feat1['voiced'], aligned_feat2['voiced'])
-        vde_error_rate = float(np.mean(vde_frames))
-
-        # 轉換為相似度：1 - 錯誤率
-        return 1.0 - vde_error_rate
-    
     def calculate_gpe(self, audio_ref: str, audio_test: str) -> float:
         """
         計算 GPE Similarity (音高相似度) - 標準版本
@@ -177,36 +303,8 @@ class SpeechMetrics:
                    1.0 = 音高完全一致（無大誤差）
                    0.0 = 音高完全不同（全部大誤差）
         """
-        feat1 = self.extract_features(audio_ref)
-        feat2 = self.extract_features(audio_test)
-        aligned_feat1, aligned_feat2 = self.align_features(feat1, feat2)
+        return self._gpe_score(*self.aligned_features(audio_ref, audio_test))
 
-        voiced_ref = aligned_feat1['voiced']
-        voiced_test = aligned_feat2['voiced']
-        both = voiced_ref & voiced_test
-
-        if not np.any(both):
-            return 0.0  # 無共同濁音段 = 完全不同
-
-        f0_ref = aligned_feat1['f0'][both]
-        f0_test = aligned_feat2['f0'][both]
-        mask = (f0_ref > 0.0) & (f0_test > 0.0)
-
-        if not np.any(mask):
-            return 0.0
-
-        f0_ref = f0_ref[mask]
-        f0_test = f0_test[mask]
-
-        abs_err = np.abs(f0_test - f0_ref)
-        rel_err = abs_err / np.maximum(f0_ref, 1e-10)
-        gross = (rel_err > 0.2) | (abs_err > self.gpe_threshold)
-
-        gpe_error_rate = float(np.mean(gross))
-
-        # 轉換為相似度：1 - 錯誤率
-        return 1.0 - gpe_error_rate
-    
     def calculate_gpe_log(self, audio_ref: str, audio_test: str,
                          threshold_semitone: float = 3.0) -> float:
         """
@@ -220,34 +318,9 @@ class SpeechMetrics:
                    1.0 = 音高偏差都在閾值內
                    0.0 = 音高偏差都超過閾值
         """
-        feat1 = self.extract_features(audio_ref)
-        feat2 = self.extract_features(audio_test)
-        aligned_feat1, aligned_feat2 = self.align_features(feat1, feat2)
-
-        voiced_ref = aligned_feat1['voiced']
-        voiced_test = aligned_feat2['voiced']
-        both = voiced_ref & voiced_test
-
-        if not np.any(both):
-            return 0.0
-
-        f0_ref = aligned_feat1['f0'][both]
-        f0_test = aligned_feat2['f0'][both]
-        mask = (f0_ref > 0.0) & (f0_test > 0.0)
-
-        if not np.any(mask):
-            return 0.0
-
-        f0_ref = f0_ref[mask]
-        f0_test = f0_test[mask]
+        return self._gpe_log_score(*self.aligned_features(audio_ref, audio_test),
+                                   threshold_semitone)
 
-        dev_semitone = np.abs(np.log2(f0_test) - np.log2(f0_ref)) * 12.0
-
-        gpe_log_error_rate = float(np.mean(dev_semitone > threshold_semitone))
-
-        # 轉換為相似度：1 - 錯誤率
-        return 1.0 - gpe_log_error_rate
-    
     def calculate_gpe_offset(self, audio_ref: str, audio_test: str,
                             threshold_semitone: float = 3.0) -> float:
         """
@@ -261,26 +334,91 @@ class SpeechMetrics:
                    1.0 = 音高輪廓一致（補償整體音高差異後）
                    0.0 = 音高輪廓完全不同
         """
-        feat1 = self.extract_features(audio_ref)
-        feat2 = self.extract_features(audio_test)
-        aligned_feat1, aligned_feat2 = self.align_features(feat1, feat2)
+        return self._gpe_offset_score(*self.aligned_features(audio_ref, audio_test),
+                                      threshold_semitone)
 
-        voiced_ref = aligned_feat1['voiced']
-        voiced_test = aligned_feat2['voiced']
-        both = voiced_ref & voiced_test
+    def calculate_energy_similarity(self, audio_ref: Union[str, parselmouth.Sound],
+                                    audio_test: Union[str, parselmouth.Sound]) -> float:
+        """
+        計算能量相似度
+        
+        Returns:
+            float: 能量相似度分數 (0-1, 越高越好)
+        """
+        return self._energy_score(*self.aligned_features(audio_ref, audio_test))
+
+    def calculate_ffe(self, audio_ref: str, audio_test: str) -> float:
+        """
+        計算 FFE Similarity (F0 幀相似度)
 
+        Returns:
+            float: FFE 相似度分數 (0-1, 越高越好)
+                   1.0 = 所有幀的 F0 都正確（無 VDE 也無 GPE 錯誤）
+                   0.0 = 所有幀的 F0 都錯誤
+        """
+        return self._ffe_score(*self.aligned_features(audio_ref, audio_test))
+
+    # ==================== 由已對齊特徵計算分數 ====================
+
+    @staticmethod
+    def _voiced_f0_pairs(aligned_feat1: dict, aligned_feat2: dict):
+        """兩段皆為濁音且 F0 > 0 的幀的 (f0_ref, f0_test)；沒有這樣的幀時回傳 None"""
+        both = aligned_feat1['voiced'] & aligned_feat2['voiced']
         if not np.any(both):
-            return 0.0
+            return None
 
         f0_ref = aligned_feat1['f0'][both]
         f0_test = aligned_feat2['f0'][both]
         mask = (f0_ref > 0.0) & (f0_test > 0.0)
 
         if not np.any(mask):
+            return None
+
+        return f0_ref[mask], f0_test[mask]
+
+    @staticmethod
+    def _vde_score(aligned_feat1: dict, aligned_feat2: dict) -> float:
+        vde_frames = np.logical_xor(aligned_feat1['voiced'], aligned_feat2['voiced'])
+        vde_error_rate = float(np.mean(vde_frames))
+
+        # 轉換為相似度：1 - 錯誤率
+        return 1.0 - vde_error_rate
+
+    def _gpe_score(self, aligned_feat1: dict, aligned_feat2: dict) -> float:
+        pairs = self._voiced_f0_pairs(aligned_feat1, aligned_feat2)
+        if pairs is None:
+            return 0.0  # 無共同濁音段 = 完全不同
+        f0_ref, f0_test = pairs
+
+        abs_err = np.abs(f0_test - f0_ref)
+        rel_err = abs_err / np.maximum(f0_ref, 1e-10)
+        gross = (rel_err > 0.2) | (abs_err > self.gpe_threshold)
+
+        gpe_error_rate = float(np.mean(gross))
+
+        # 轉換為相似度：1 - 錯誤率
+        return 1.0 - gpe_error_rate
+
+    def _gpe_log_score(self, aligned_feat1: dict, aligned_feat2: dict,
+                       threshold_semitone: float) -> float:
+        pairs = self._voiced_f0_pairs(aligned_feat1, aligned_feat2)
+        if pairs is None:
             return 0.0
+        f0_ref, f0_test = pairs
 
-        f0_ref = f0_ref[mask]
-        f0_test = f0_test[mask]
+        dev_semitone = np.abs(np.log2(f0_test) - np.log2(f0_ref)) * 12.0
+
+        gpe_log_error_rate = float(np.mean(dev_semitone > threshold_semitone))
+
+        # 轉換為相似度：1 - 錯誤率
+        return 1.0 - gpe_log_error_rate
+
+    def _gpe_offset_score(self, aligned_feat1: dict, aligned_feat2: dict,
+                          threshold_semitone: float) -> float:
+        pairs = self._voiced_f0_pairs(aligned_feat1, aligned_feat2)
+        if pairs is None:
+            return 0.0
+        f0_ref, f0_test = pairs
 
         log_ref = np.log2(f0_ref)
         log_test = np.log2(f0_test)
@@ -292,18 +430,9 @@ class SpeechMetrics:
 
         # 轉換為相似度：1 - 錯誤率
         return 1.0 - gpe_offset_error_rate
-    
-    def calculate_energy_similarity(self, audio_ref: str, audio_test: str) -> float:
-        """
-        計算能量相似度
-        
-        Returns:
-            float: 能量相似度分數 (0-1, 越高越好)
-        """
-        feat1 = self.extract_features(audio_ref)
-        feat2 = self.extract_features(audio_test)
-        aligned_feat1, aligned_feat2 = self.align_features(feat1, feat2)
-        
+
+    @staticmethod
+    def _energy_score(aligned_feat1: dict, aligned_feat2: dict) -> float:
         intensity1 = aligned_feat1['intensity']
         intensity2 = aligned_feat2['intensity']
         
@@ -313,20 +442,8 @@ class SpeechMetrics:
             return 0.0
         
         return float((corr + 1.0) / 2.0)
-    
-    def calculate_ffe(self, audio_ref: str, audio_test: str) -> float:
-        """
-        計算 FFE Similarity (F0 幀相似度)
-
-        Returns:
-            float: FFE 相似度分數 (0-1, 越高越好)
-                   1.0 = 所有幀的 F0 都正確（無 VDE 也無 GPE 錯誤）
-                   0.0 = 所有幀的 F0 都錯誤
-        """
-        feat1 = self.extract_features(audio_ref)
-        feat2 = self.extract_features(audio_test)
-        aligned_feat1, aligned_feat2 = self.align_features(feat1, feat2)
 
+    def _ffe_score(self, aligned_feat1: dict, aligned_feat2: dict) -> float:
         voiced_ref = aligned_feat1['voiced']
         voiced_test = aligned_feat2['voiced']
 
@@ -350,4 +467,3 @@ class SpeechMetrics:
 
         # 轉換為相似度：1 - 錯誤率
         return 1.0 - ffe_error_rate
-
@@ -237,6 +237,35 @@ class SupabaseClient:
             print(f"❌ Failed to get AI scores by course: {str(e)}")
             return []
 
+    def get_ai_scores_grouped(
+        self,
+        user_id: str,
+        course_id: str
+    ) -> Optional[Dict[str, Dict[str, float]]]:
+        """
+        取得某個課程的所有評分，由資料庫端分組
+        (需要先執行 migrations/create_get_ai_scores_grouped_function.sql)
+
+        Args:
+            user_id: 使用者 ID
+            course_id: 課程 ID
+
+        Returns:
+            Optional[Dict]: {sentence_id: {slot_index: score}}，
+            如果 RPC 呼叫失敗（例如函式尚未建立）則回傳 None
+        """
+        try:
+            result = self.client.rpc('get_ai_scores_grouped', {
+                'p_user_id': user_id,
+                'p_course_id': course_id
+            }).execute()
+
+            return result.data or {}
+
+        except Exception as e:
+            print(f"⚠️  Failed to get grouped AI scores: {str(e)}")
+            return None
+
     def delete_ai_score(
         self,
         user_id: str,
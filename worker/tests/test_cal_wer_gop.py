@@ -0,0 +1,80 @@
+"""
+GOP 對齊測試：numba 的 _dtw_path 需與原本以 Python 迴圈填表、np.argmin 回溯的路徑一致
+"""
+
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# cal_wer_gop 在 import 時需要 whisper、soxr 與 librosa（經由 preprocessing）
+for _module in ("whisper", "soxr", "librosa"):
+    pytest.importorskip(_module)
+
+from services.cal_wer_gop import _band_radius, _dtw_path  # noqa: E402
+
+
+def _dtw_path_reference(distance: np.ndarray, band_radius=None):
+    """原本的 DTW：完整或 band 內逐格填表，回溯時以 np.argmin 選 (上, 左, 左上)"""
+    num_test, num_ref = distance.shape
+    slope = num_ref / num_test
+    acc = np.full((num_test + 1, num_ref + 1), np.inf, dtype=np.float32)
+    acc[0, 0] = 0.0
+    for i in range(1, num_test + 1):
+        for j in range(1, num_ref + 1):
+            if band_radius is not None and not (
+                math.ceil(i * slope - band_radius) <= j <= int(i * slope + band_radius)
+            ):
+                continue
+            acc[i, j] = distance[i - 1, j - 1] + min(acc[i - 1, j], acc[i, j - 1], acc[i - 1, j - 1])
+
+    i, j = num_test, num_ref
+    path_test, path_ref = [], []
+    while i > 0 and j > 0:
+        path_test.append(i - 1)
+        path_ref.append(j - 1)
+        move = int(np.argmin((acc[i - 1, j], acc[i, j - 1], acc[i - 1, j - 1])))
+        if move == 0:
+            i -= 1
+        elif move == 1:
+            j -= 1
+        else:
+            i -= 1
+            j -= 1
+    while i > 0:
+        path_test.append(i - 1)
+        path_ref.append(0)
+        i -= 1
+    while j > 0:
+        path_test.append(0)
+        path_ref.append(j - 1)
+        j -= 1
+    return path_test[::-1], path_ref[::-1]
+
+
+def test_full_dtw_path_matches_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        n, m = rng.integers(1, 30, size=2)
+        distance = rng.random((n, m)).astype(np.float32)
+        path_test, path_ref = _dtw_path(distance, _band_radius(n, m, None))
+        expected_test, expected_ref = _dtw_path_reference(distance)
+        assert path_test.tolist() == expected_test
+        assert path_ref.tolist() == expected_ref
+
+
+def test_banded_dtw_path_matches_reference():
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        n, m = rng.integers(20, 80, size=2)
+        distance = rng.random((n, m)).astype(np.float32)
+        radius = _band_radius(n, m, 0.1)
+        path_test, path_ref = _dtw_path(distance, radius)
+        expected_test, expected_ref = _dtw_path_reference(distance, radius)
+        assert path_test.tolist() == expected_test
+        assert path_ref.tolist() == expected_ref
+        assert path_test[-1] == n - 1 and path_ref[-1] == m - 1
@@ -0,0 +1,50 @@
+"""
+編輯距離測試：純 Python bit-parallel 實作需與一般 DP 結果一致
+"""
+
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from services.edit_distance import _levenshtein_bitparallel, levenshtein  # noqa: E402
+
+
+def _levenshtein_dp(ref, hyp) -> int:
+    """O(m·n) 的標準 DP，作為對照組"""
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        curr = [i]
+        for j, h in enumerate(hyp, 1):
+            curr.append(min(prev[j] + 1, curr[j - 1] + 1, prev[j - 1] + (r != h)))
+        prev = curr
+    return prev[-1]
+
+
+def test_empty_inputs():
+    assert _levenshtein_bitparallel([], []) == 0
+    assert _levenshtein_bitparallel([], ['a', 'b']) == 2
+    assert _levenshtein_bitparallel(['a', 'b', 'c'], []) == 3
+
+
+def test_docstring_example():
+    assert levenshtein(['h', 'ə', 'l', 'oʊ'], ['h', 'ɛ', 'l', 'oʊ']) == 1
+
+
+def test_matches_dp_on_random_pairs():
+    rng = random.Random(0)
+    alphabet = ['a', 'b', 'c', 'd', 'ə', 'oʊ']
+    for _ in range(2000):
+        ref = rng.choices(alphabet, k=rng.randint(0, 20))
+        hyp = rng.choices(alphabet, k=rng.randint(0, 20))
+        assert _levenshtein_bitparallel(ref, hyp) == _levenshtein_dp(ref, hyp), (ref, hyp)
+
+
+def test_matches_dp_beyond_64_elements():
+    rng = random.Random(1)
+    alphabet = ['a', 'b', 'c', 'd']
+    for _ in range(50):
+        ref = rng.choices(alphabet, k=rng.randint(65, 200))
+        hyp = rng.choices(alphabet, k=rng.randint(0, 200))
+        assert _levenshtein_bitparallel(ref, hyp) == _levenshtein_dp(ref, hyp)
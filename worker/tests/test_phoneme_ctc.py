@@ -0,0 +1,116 @@
+"""
+CTC greedy 解碼測試：向量化的 _spans_from_logp 需與逐幀的標準 CTC collapse 一致
+"""
+
+import random
+import sys
+from pathlib import Path
+
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from services.phoneme_ctc import PhoneCTC  # noqa: E402
+
+BLANK = 0
+
+
+def _make_ctc() -> PhoneCTC:
+    """不載入模型，只設定解碼需要的 blank id"""
+    ctc = PhoneCTC.__new__(PhoneCTC)
+    ctc.blank = BLANK
+    return ctc
+
+
+def _logp_from_ids(ids, vocab_size: int = 6) -> torch.Tensor:
+    """argmax 為指定 id 序列的 log-posteriorgram"""
+    logits = torch.full((len(ids), vocab_size), -5.0)
+    logits[torch.arange(len(ids)), torch.tensor(ids, dtype=torch.long)] = 5.0
+    return torch.log_softmax(logits, dim=-1)
+
+
+def _baseline_collapse(ids) -> list:
+    """原本逐幀解碼的音素序列：移除重複，再移除 blank"""
+    collapsed, prev = [], None
+    for pid in ids:
+        if pid == BLANK:
+            prev = pid
+            continue
+        if pid != prev:
+            collapsed.append(pid)
+        prev = pid
+    return collapsed
+
+
+def _reference_spans(ids) -> list:
+    """逐幀找出每段非 blank 的連續相同 id"""
+    spans = []
+    for t, pid in enumerate(ids):
+        if t > 0 and pid == ids[t - 1]:
+            if pid != BLANK:
+                spans[-1] = (pid, spans[-1][1], t)
+        elif pid != BLANK:
+            spans.append((pid, t, t))
+    return spans
+
+
+def test_repeat_across_blank_is_two_phones():
+    ids = [2, 0, 2, 1, 1, 1, 0, 2]
+    spans = _make_ctc()._spans_from_logp(_logp_from_ids(ids))
+
+    assert spans.pid.tolist() == _baseline_collapse(ids) == [2, 2, 1, 2]
+    assert spans.to_list() == [(2, 0, 0), (2, 2, 2), (1, 3, 5), (2, 7, 7)]
+
+
+def test_empty_and_all_blank():
+    ctc = _make_ctc()
+    assert len(ctc._spans_from_logp(torch.zeros(0, 6))) == 0
+    assert len(ctc._spans_from_logp(_logp_from_ids([0, 0, 0]))) == 0
+
+
+def test_matches_reference_on_random_sequences():
+    ctc = _make_ctc()
+    rng = random.Random(0)
+    for _ in range(500):
+        ids = rng.choices(range(4), k=rng.randint(1, 40))
+        spans = ctc._spans_from_logp(_logp_from_ids(ids))
+        assert spans.pid.tolist() == _baseline_collapse(ids), ids
+        assert spans.to_list() == _reference_spans(ids), ids
+
+
+def test_batch_path_fills_and_reuses_memory_cache(tmp_path, monkeypatch):
+    import threading
+    from collections import OrderedDict
+
+    import numpy as np
+    import soundfile as sf
+
+    from services import phoneme_ctc
+
+    monkeypatch.setattr(phoneme_ctc, "PPG_CACHE_DIR", tmp_path / "ppg")
+    ctc = _make_ctc()
+    ctc.model_name = "test"
+    ctc._memory_cache = OrderedDict()
+    ctc._memory_lock = threading.Lock()
+
+    calls = []
+
+    def fake_batch(wavs, srs):
+        calls.append(len(wavs))
+        logp = _logp_from_ids([1, 0, 2])
+        return [(logp, ctc._spans_from_logp(logp)) for _ in wavs]
+
+    ctc.posteriors_and_spans_batch = fake_batch
+
+    audio = tmp_path / "a.wav"
+    sf.write(audio, np.zeros(1600, dtype=np.float32), 16000)
+
+    first = ctc.cached_posteriors_and_spans_batch([audio])
+    # 第二次由記憶體 LRU 取得同一份結果，不再執行模型
+    assert ctc.cached_posteriors_and_spans_batch([audio])[0] is first[0]
+    assert ctc.cached_posteriors_and_spans(audio) is first[0]
+    assert calls == [1]
+
+
+def test_proc_fd_paths_are_not_cached():
+    assert PhoneCTC._file_key("/proc/self/fd/3") is None
@@ -0,0 +1,103 @@
+"""
+GOP 測試：向量化的 _gops_from_spans 與 numba 的 _dtw_phone 需與原本逐片段、逐格的實作一致
+"""
+
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from services.phoneme_ctc import SpanArr  # noqa: E402
+from services.phoneme_gop import GopArr, _dtw_phone, _gops_from_spans  # noqa: E402
+
+BLANK = 0
+
+
+def _gops_reference(logp: torch.Tensor, spans: list, blank_id: int) -> list:
+    """原本逐片段計算的 GOP"""
+    T, V = logp.shape
+    out = []
+    for pid, t1, t2 in spans:
+        if t1 > t2 or t1 < 0 or t2 >= T:
+            continue
+        seg = logp[t1 : t2 + 1, :]
+        mask = torch.ones(V, dtype=torch.bool)
+        mask[pid] = False
+        if 0 <= blank_id < V:
+            mask[blank_id] = False
+        comp = torch.max(seg[:, mask], dim=-1).values
+        out.append((int(pid), float((seg[:, pid] - comp).mean().item()), int(t2 - t1 + 1)))
+    return out
+
+
+def _dtw_phone_reference(gops_a: list, gops_b: list, tau: float = 1.0, lam: float = 0.01, band=None) -> float:
+    """原本以完整矩陣逐格計算的同音素 DTW"""
+    if not gops_a or not gops_b:
+        return 0.0
+    n, m = len(gops_a), len(gops_b)
+    D = np.full((n + 1, m + 1), np.inf, dtype=np.float32)
+    D[0, 0] = 0.0
+    for i in range(1, n + 1):
+        pid_i, gi, di = gops_a[i - 1]
+        jmin = 1 if band is None else max(1, i - band)
+        jmax = m if band is None else min(m, i + band)
+        for j in range(jmin, jmax + 1):
+            pid_j, gj, dj = gops_b[j - 1]
+            cost = abs(gi - gj) + lam * abs(di - dj) if pid_i == pid_j else 1.5
+            D[i, j] = min(D[i - 1, j] + 0.5, D[i, j - 1] + 0.5, D[i - 1, j - 1] + cost)
+    return float(math.exp(-(D[n, m] / (n + m)) / tau))
+
+
+def _random_spans(rng: np.random.Generator, T: int, V: int, count: int) -> list:
+    spans = []
+    for _ in range(count):
+        t1 = int(rng.integers(-2, T))
+        t2 = int(t1 + rng.integers(-1, 6))  # 包含起點大於終點、超出範圍的片段
+        spans.append((int(rng.integers(1, V)), t1, t2))
+    return spans
+
+
+def _to_spanarr(spans: list) -> SpanArr:
+    cols = np.array(spans, dtype=np.int64).reshape(-1, 3)
+    return SpanArr(cols[:, 0].copy(), cols[:, 1].copy(), cols[:, 2].copy())
+
+
+def test_gops_from_spans_matches_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(30):
+        T, V = int(rng.integers(5, 40)), 6
+        logp = torch.log_softmax(torch.from_numpy(rng.normal(size=(T, V)) * 3).float(), dim=1)
+        spans = _random_spans(rng, T, V, int(rng.integers(1, 10)))
+
+        got = _gops_from_spans(logp, _to_spanarr(spans), BLANK).to_list()
+        expected = _gops_reference(logp, spans, BLANK)
+        assert [(p, d) for p, _, d in got] == [(p, d) for p, _, d in expected]
+        np.testing.assert_allclose([g for _, g, _ in got], [g for _, g, _ in expected], rtol=1e-5, atol=1e-5)
+
+
+def test_dtw_phone_matches_reference():
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        gops = [
+            [(int(rng.integers(1, 4)), float(rng.normal()), int(rng.integers(1, 10)))
+             for _ in range(int(rng.integers(1, 15)))]
+            for _ in range(2)
+        ]
+        band = None if rng.random() < 0.5 else int(rng.integers(0, 5))
+        arrs = [
+            GopArr(
+                np.array([p for p, _, _ in g], dtype=np.int64),
+                np.array([s for _, s, _ in g], dtype=np.float64),
+                np.array([d for _, _, d in g], dtype=np.int64),
+            )
+            for g in gops
+        ]
+        np.testing.assert_allclose(
+            _dtw_phone(arrs[0], arrs[1], band=band),
+            _dtw_phone_reference(gops[0], gops[1], band=band),
+            rtol=1e-6,
+        )
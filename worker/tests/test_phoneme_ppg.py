@@ -0,0 +1,109 @@
+"""
+PPG 相似度測試：融合 JSD 的 DTW kernel 與 band 條帶儲存，需與完整成本矩陣 + 逐格 DTW 的結果一致
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from services.phoneme_ppg import (  # noqa: E402
+    _dtw_cost_band,
+    _dtw_distance,
+    _fused_jsd_dtw_kernel,
+    _jsd_band_torch,
+    _jsd_divergence,
+    _jsd_matrix_torch,
+)
+
+V = 7
+
+
+def _random_logp(rng: np.random.Generator, n: int) -> torch.Tensor:
+    return torch.log_softmax(torch.from_numpy(rng.normal(size=(n, V)) * 2).float(), dim=1)
+
+
+def _jsd_matrix_reference(log_pa: torch.Tensor, log_pb: torch.Tensor) -> np.ndarray:
+    """逐對呼叫 _jsd_divergence 的成本矩陣"""
+    Pa, Pb = log_pa.exp().double().numpy(), log_pb.exp().double().numpy()
+    return np.array([[_jsd_divergence(p, q) for q in Pb] for p in Pa])
+
+
+def _dtw_reference(D: np.ndarray, band: int) -> float:
+    """完整 (n+1)x(m+1) 矩陣的逐格 DTW，band < 0 表示不限制"""
+    n, m = D.shape
+    acc = np.full((n + 1, m + 1), np.inf)
+    acc[0, 0] = 0.0
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            if band >= 0 and abs(i - j) > band:
+                continue
+            acc[i, j] = D[i - 1, j - 1] + min(acc[i - 1, j], acc[i, j - 1], acc[i - 1, j - 1])
+    return acc[n, m]
+
+
+def _assert_cost_close(got: float, expected: float) -> None:
+    if np.isinf(expected):
+        assert np.isinf(got)
+    else:
+        np.testing.assert_allclose(got, expected, rtol=1e-4, atol=1e-5)
+
+
+def test_jsd_matrix_matches_reference():
+    rng = np.random.default_rng(0)
+    log_pa, log_pb = _random_logp(rng, 9), _random_logp(rng, 12)
+    np.testing.assert_allclose(
+        _jsd_matrix_torch(log_pa, log_pb).numpy(),
+        _jsd_matrix_reference(log_pa, log_pb),
+        rtol=1e-4, atol=1e-6,
+    )
+
+
+def test_fused_jsd_dtw_matches_reference():
+    rng = np.random.default_rng(1)
+    kernel = _fused_jsd_dtw_kernel(V)
+    for _ in range(100):
+        na, nb = rng.integers(1, 25, size=2)
+        band = int(rng.integers(-1, 8))
+        log_pa, log_pb = _random_logp(rng, na), _random_logp(rng, nb)
+        log_Pa = np.ascontiguousarray(log_pa.numpy())
+        log_Pb = np.ascontiguousarray(log_pb.numpy())
+
+        got = kernel(np.exp(log_Pa), log_Pa, np.exp(log_Pb), log_Pb, band, 1e-12)
+        expected = _dtw_reference(_jsd_matrix_reference(log_pa, log_pb), band)
+        _assert_cost_close(got, expected)
+
+
+def test_dtw_distance_matches_reference():
+    rng = np.random.default_rng(2)
+    for _ in range(50):
+        n, m = rng.integers(1, 25, size=2)
+        band = int(rng.integers(0, 8))
+        D = rng.random((n, m)).astype(np.float32)
+        expected_full = _dtw_reference(D, -1) / (n + m)
+        np.testing.assert_allclose(_dtw_distance(D), expected_full, rtol=1e-5)
+        _assert_cost_close(_dtw_distance(D, band=band), _dtw_reference(D, band) / (n + m))
+
+
+def test_band_strip_matches_full_matrix():
+    rng = np.random.default_rng(3)
+    for _ in range(30):
+        na, nb = rng.integers(1, 25, size=2)
+        band = int(rng.integers(0, 8))
+        log_pa, log_pb = _random_logp(rng, na), _random_logp(rng, nb)
+
+        D_band = _jsd_band_torch(log_pa, log_pb, band).numpy()
+        D = _jsd_matrix_torch(log_pa, log_pb).numpy()
+        for i in range(na):
+            for k in range(2 * band + 1):
+                j = i - band + k
+                if 0 <= j < nb:
+                    np.testing.assert_allclose(D_band[i, k], D[i, j], rtol=1e-5, atol=1e-7)
+                else:
+                    assert np.isinf(D_band[i, k])
+
+        got = _dtw_cost_band(np.ascontiguousarray(D_band), nb, band)
+        _assert_cost_close(got, _dtw_reference(D.astype(np.float64), band))
@@ -0,0 +1,47 @@
+"""
+評分預測器測試：合併標準化的 NumPy 前向傳播需與原本 scaler.transform + TinyModel 的結果一致
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from services.predictor import RatingPredictor  # noqa: E402
+
+FEATURES = [
+    [0.95, 0.998, 0.97],
+    [0.80, 0.995, 0.92],
+    [0.65, 0.988, 0.85],
+    [0.45, 0.980, 0.80],
+    [0.0, 0.5, 0.1],
+    [1.0, 1.0, 1.0],
+]
+
+
+def _reference_predictions(predictor: RatingPredictor, features: list) -> list:
+    """原本的流程：sklearn 標準化後送入 PyTorch 模型，再限制在 1-5"""
+    scaled = predictor.scaler.transform(np.array(features, dtype=np.float64))
+    with torch.no_grad():
+        out = predictor.model(torch.tensor(scaled, dtype=torch.float32, device=predictor.device))
+    return [max(1.0, min(5.0, float(v))) for v in out.reshape(-1).cpu().tolist()]
+
+
+def test_fused_forward_matches_scaler_and_model():
+    predictor = RatingPredictor()
+    expected = _reference_predictions(predictor, FEATURES)
+
+    np.testing.assert_allclose(predictor.predict_batch(FEATURES), expected, rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(
+        [predictor.predict(f) for f in FEATURES], expected, rtol=1e-5, atol=1e-5
+    )
+
+
+def test_predict_accepts_dict_features():
+    predictor = RatingPredictor()
+    features = {'score_PER': 0.85, 'score_PPG': 0.995, 'score_Energy': 0.95}
+    assert predictor.predict(features) == predictor.predict([0.85, 0.995, 0.95])
+    assert predictor.predict_batch([]) == []
@@ -0,0 +1,104 @@
+"""
+韻律特徵測試：一次取出整條軌跡的 extract_features 需與原本逐幀呼叫 Praat 的結果一致，
+DTW 前向計算的 numba kernel 需與逐格的參考實作一致
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import parselmouth
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from services.speech_metrics import SpeechMetrics, _dtw_fill, _praat_cubic_interp  # noqa: E402
+
+
+def _make_sound(seed: int, seconds: float = 1.2, sr: int = 16000) -> parselmouth.Sound:
+    """音高滑動的諧波訊號，前後各有一段靜音"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 120 + 60 * t / seconds
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    wav = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = ((t > 0.2) & (t < seconds - 0.2)).astype(float)
+    wav = 0.3 * wav * envelope + 0.001 * rng.normal(size=t.size)
+    return parselmouth.Sound(wav, sampling_frequency=sr)
+
+
+def _baseline_features(metrics: SpeechMetrics, sound: parselmouth.Sound) -> dict:
+    """原本逐幀呼叫 Praat 的特徵提取"""
+    pitch = sound.to_pitch(time_step=metrics.frame_shift, pitch_floor=75.0, pitch_ceiling=600.0)
+    f0_values, time_points = [], []
+    for i in range(pitch.n_frames):
+        t = pitch.get_time_from_frame_number(i + 1)
+        f0 = pitch.get_value_at_time(t)
+        f0_values.append(f0 if f0 is not None and not np.isnan(f0) else 0.0)
+        time_points.append(t)
+    f0_values = np.nan_to_num(np.array(f0_values, dtype=float))
+
+    intensity = sound.to_intensity(time_step=metrics.frame_shift, minimum_pitch=75.0)
+    intensity_values = np.nan_to_num(
+        np.array([intensity.get_value(t) for t in time_points], dtype=float)
+    )
+    voiced = (f0_values > 0.0) & (intensity_values > 30.0)
+    return {'f0': f0_values, 'intensity': intensity_values, 'voiced': voiced}
+
+
+def test_extract_features_matches_per_frame_praat():
+    metrics = SpeechMetrics()
+    for seed in range(3):
+        sound = _make_sound(seed)
+        got = metrics.extract_features(sound)
+        expected = _baseline_features(metrics, sound)
+        np.testing.assert_allclose(got['f0'], expected['f0'], rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(got['intensity'], expected['intensity'], rtol=1e-9, atol=1e-9)
+        np.testing.assert_array_equal(got['voiced'], expected['voiced'])
+
+
+def test_cubic_interp_matches_praat_get_value():
+    rng = np.random.default_rng(0)
+    sound = parselmouth.Sound(rng.normal(size=8000) * rng.random(8000), sampling_frequency=16000)
+    intensity = sound.to_intensity(time_step=0.01, minimum_pitch=75.0)
+    # 取樣點、任意時間點，以及取樣範圍外的時間點
+    times = np.r_[intensity.xs(), rng.uniform(-0.1, sound.xmax + 0.1, 300)]
+
+    got = _praat_cubic_interp(intensity.values[0], intensity.x1, intensity.dx, times)
+    expected = np.array([intensity.get_value(t) for t in times], dtype=float)
+    np.testing.assert_allclose(got, expected, rtol=1e-12, atol=1e-9, equal_nan=True)
+
+
+def _reference_dtw(s1: np.ndarray, s2: np.ndarray, band: int) -> np.ndarray:
+    """逐格計算的 banded DTW 累積成本"""
+    n, m = len(s1), len(s2)
+    dtw = np.full((n + 1, m + 1), np.inf)
+    dtw[0, 0] = 0.0
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            if abs(i - j) > band:
+                continue
+            d = np.linalg.norm(s1[i - 1] - s2[j - 1])
+            dtw[i, j] = d + min(dtw[i - 1, j - 1], dtw[i - 1, j], dtw[i, j - 1])
+    return dtw
+
+
+def test_dtw_fill_matches_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        n, m = rng.integers(1, 30, size=2)
+        s1, s2 = rng.normal(size=(n, 2)), rng.normal(size=(m, 2))
+        band = max(abs(int(n) - int(m)), max(n, m) // 10)
+        dtw, _ = _dtw_fill(s1, s2, band)
+        np.testing.assert_allclose(dtw, _reference_dtw(s1, s2, band), rtol=1e-12)
+
+
+def test_dtw_alignment_path_is_monotonic_and_complete():
+    metrics = SpeechMetrics()
+    rng = np.random.default_rng(1)
+    seq1, seq2 = rng.normal(size=40), rng.normal(size=55)
+    path = metrics.dtw_alignment(seq1, seq2)
+
+    assert path[0] == (0, 0)
+    assert path[-1] == (39, 54)
+    for (i0, j0), (i1, j1) in zip(path, path[1:]):
+        assert (i1 - i0, j1 - j0) in {(1, 0), (0, 1), (1, 1)}